@@ -3,64 +3,23 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from logging_config import configure_logging, dropped_log_records, ensure_log_listener, stop_log_listener
+from health import health_monitor
 
 # Load environment variables
 load_dotenv()
 
-# Create Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['JSON_SORT_KEYS'] = False
-
-# Configure CORS
-frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
-CORS(app, resources={
-    r"/api/*": {
-        "origins": [frontend_url, "https://swkwon.github.io"],
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Type", "Authorization"],
-        "supports_credentials": True
-    }
-})
-
-# Import routes
-from routes.auth_routes import auth_bp
-from routes.diagram_routes import diagram_bp
-
-# Register blueprints
-app.register_blueprint(auth_bp)
-app.register_blueprint(diagram_bp)
-
-# Configure logging
-if not app.debug:
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-
-    # Setup file handler with rotation (max 10MB, keep 10 backup files)
-    file_handler = RotatingFileHandler('logs/mermaid-editor.log', maxBytes=10240000, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
-    app.logger.info('Mermaid Editor API startup')
-else:
-    # In development, log to console with more detail
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    )
-
 
 # Add cache-control headers to all responses
-@app.after_request
 def add_cache_control_headers(response):
-    """Add cache control headers to prevent client-side caching."""
+    """Add cache control headers to prevent client-side caching.
+
+    Responses that set their own Cache-Control (public share links) keep it.
+    """
+    if 'Cache-Control' in response.headers:
+        return response
+
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, private'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
@@ -68,7 +27,6 @@ def add_cache_control_headers(response):
 
 
 # Health check endpoint
-@app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
     return jsonify({
@@ -77,32 +35,159 @@ def health_check():
     }), 200
 
 
+def liveness_check():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({'status': 'ok'}), 200
+
+
+def readiness_check():
+    """Readiness probe: answered from the background health monitor."""
+    ready, details = health_monitor.status()
+    details['log_records_dropped'] = dropped_log_records()
+    return jsonify(details), 200 if ready else 503
+
+
 # Error handlers
-@app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors."""
     return jsonify({'error': 'Not found'}), 404
 
 
-@app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors."""
     return jsonify({'error': 'Internal server error'}), 500
 
 
-@app.errorhandler(403)
 def forbidden(error):
     """Handle 403 errors."""
     return jsonify({'error': 'Forbidden'}), 403
 
 
-@app.errorhandler(400)
 def bad_request(error):
     """Handle 400 errors."""
     return jsonify({'error': 'Bad request'}), 400
 
 
+def start_background_services():
+    """Start per-process background work.
+
+    Safe to call after fork: every service checks the current PID and
+    re-creates its threads (and the DB pool re-creates its connections)
+    instead of reusing state inherited from the parent.
+    """
+    ensure_log_listener()
+    health_monitor.start()
+
+    # Purge expired trash in the background
+    if os.getenv('TRASH_PURGE_ENABLED', 'false').lower() == 'true':
+        from trash_purger import trash_purger
+        trash_purger.start()
+
+
+def stop_background_services(timeout=10):
+    """Finish background work before the process exits.
+
+    Called from the gunicorn ``worker_exit`` hook once in-flight requests
+    are done: lets the purger finish its batch, flushes queued log records
+    and closes pooled connections.
+    """
+    from database import db
+    from trash_purger import trash_purger
+
+    health_monitor.start_draining()
+    health_monitor.stop(timeout)
+    trash_purger.stop(timeout)
+    stop_log_listener()
+    db.close_pool()
+
+
+def create_app(start_background=True):
+    """Create and configure the Flask application.
+
+    Pass ``start_background=False`` when the app is preloaded in a process
+    that will fork (gunicorn ``--preload``); workers then call
+    :func:`start_background_services` from the ``post_fork`` hook in
+    gunicorn.conf.py.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['JSON_SORT_KEYS'] = False
+
+    # Configure CORS
+    frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": [frontend_url, "https://swkwon.github.io"],
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "If-None-Match", "Idempotency-Key"],
+            "expose_headers": [
+                "Content-Type", "Authorization", "X-Request-ID", "ETag", "Idempotent-Replayed"
+            ],
+            "supports_credentials": True
+        }
+    })
+
+    # Configure logging (file I/O happens on a background listener thread)
+    configure_logging(app)
+    app.logger.info('Mermaid Editor API startup')
+
+    # Import routes
+    from routes.auth_routes import auth_bp
+    from routes.diagram_routes import diagram_bp
+    from routes.folder_routes import folder_bp
+    from routes.public_routes import public_bp
+    from routes.audit_routes import audit_bp
+
+    # Register blueprints
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(diagram_bp)
+    app.register_blueprint(folder_bp)
+    app.register_blueprint(public_bp)
+    app.register_blueprint(audit_bp)
+
+    app.after_request(add_cache_control_headers)
+    app.add_url_rule('/api/health', 'health_check', health_check, methods=['GET'])
+    app.add_url_rule('/api/health/live', 'liveness_check', liveness_check, methods=['GET'])
+    app.add_url_rule('/api/health/ready', 'readiness_check', readiness_check, methods=['GET'])
+
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(500, internal_error)
+    app.register_error_handler(403, forbidden)
+    app.register_error_handler(400, bad_request)
+
+    if start_background:
+        start_background_services()
+
+    return app
+
+
+class LazyApp:
+    """WSGI entry point for servers still launching ``app:app``.
+
+    The application is built on the first request in each process, so
+    importing this module stays free of side effects (and fork-safe) while
+    existing ``gunicorn app:app`` deployments keep booting. Background
+    services start with it; starting them again from gunicorn hooks is a
+    no-op.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._app = create_app()
+        return self._app(environ, start_response)
+
+
+# Compatibility entry point; new deployments use gunicorn.conf.py
+app = LazyApp()
+
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5050))
     debug = os.getenv('FLASK_ENV') == 'development'
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    create_app().run(host='0.0.0.0', port=port, debug=debug)
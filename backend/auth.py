@@ -3,7 +3,7 @@ import jwt
 import hashlib
 import secrets
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import lru_cache, wraps
 from flask import request, jsonify
 import os
 from database import db
@@ -17,11 +17,17 @@ class AuthManager:
         self.access_token_expires = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 3600))
         self.refresh_token_expires = int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 2592000))
 
-    def generate_access_token(self, user_id, email):
-        """Generate JWT access token."""
+    def new_access_token_id(self):
+        """Return a fresh (jti, expires_at) pair for an access token."""
         jti = secrets.token_urlsafe(32)
         expires_at = datetime.utcnow() + timedelta(seconds=self.access_token_expires)
+        return jti, expires_at
 
+    def encode_access_token(self, user_id, email, jti, expires_at):
+        """Sign a JWT access token without touching the database.
+
+        The caller is responsible for storing the matching session row.
+        """
         payload = {
             'user_id': user_id,
             'email': email,
@@ -31,7 +37,22 @@ class AuthManager:
             'type': 'access'
         }
 
-        token = jwt.encode(payload, self.jwt_secret, algorithm='HS256')
+        return jwt.encode(payload, self.jwt_secret, algorithm='HS256')
+
+    def new_refresh_token(self):
+        """Return a fresh (token, token_hash, expires_at) refresh token triple.
+
+        Only the hash is ever stored in the database.
+        """
+        token = secrets.token_urlsafe(64)
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        expires_at = datetime.utcnow() + timedelta(seconds=self.refresh_token_expires)
+        return token, token_hash, expires_at
+
+    def generate_access_token(self, user_id, email):
+        """Generate JWT access token."""
+        jti, expires_at = self.new_access_token_id()
+        token = self.encode_access_token(user_id, email, jti, expires_at)
 
         # Store session in database
         ip_address = request.remote_addr if request else None
@@ -47,9 +68,7 @@ class AuthManager:
 
     def generate_refresh_token(self, user_id):
         """Generate refresh token."""
-        token = secrets.token_urlsafe(64)
-        token_hash = hashlib.sha256(token.encode()).hexdigest()
-        expires_at = datetime.utcnow() + timedelta(seconds=self.refresh_token_expires)
+        token, token_hash, expires_at = self.new_refresh_token()
 
         query = """
             INSERT INTO t_refresh_tokens (user_id, token_hash, expires_at)
@@ -124,6 +143,12 @@ class AuthManager:
         db.execute_query(query)
 
 
+@lru_cache(maxsize=None)
+def get_auth_manager():
+    """Return the shared auth manager, created on first use."""
+    return AuthManager()
+
+
 # Decorator for protected routes
 def require_auth(f):
     """Decorator to require authentication for routes."""
@@ -135,8 +160,7 @@ def require_auth(f):
             return jsonify({'error': 'Missing or invalid authorization header'}), 401
 
         token = auth_header.split(' ')[1]
-        auth_manager = AuthManager()
-        payload = auth_manager.verify_access_token(token)
+        payload = get_auth_manager().verify_access_token(token)
 
         if not payload:
             return jsonify({'error': 'Invalid or expired token'}), 401
@@ -150,11 +174,32 @@ def require_auth(f):
     return decorated_function
 
 
+@lru_cache(maxsize=None)
+def get_admin_emails():
+    """Return the lowercased emails listed in ``ADMIN_EMAILS``."""
+    return frozenset(
+        email.strip().lower()
+        for email in os.getenv('ADMIN_EMAILS', '').split(',')
+        if email.strip()
+    )
+
+
+def require_admin(f):
+    """Decorator to restrict a route to admins. Apply below ``require_auth``."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if (getattr(request, 'user_email', None) or '').lower() not in get_admin_emails():
+            return jsonify({'error': 'Admin access required'}), 403
+
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
 def log_audit(action, resource_type=None, resource_id=None, metadata=None):
     """Log an audit event."""
     import json
     import logging
-    import traceback
 
     logger = logging.getLogger(__name__)
 
@@ -166,7 +211,7 @@ def log_audit(action, resource_type=None, resource_id=None, metadata=None):
         # Convert metadata to JSON string for JSONB column
         metadata_json = json.dumps(metadata) if metadata else None
 
-        logger.debug(f"Audit log: action={action}, user_id={user_id}, metadata={metadata_json}")
+        logger.debug("Audit log: action=%s, user_id=%s, metadata=%s", action, user_id, metadata_json)
 
         query = """
             INSERT INTO t_audit_logs
@@ -178,7 +223,6 @@ def log_audit(action, resource_type=None, resource_id=None, metadata=None):
             (user_id, action, resource_type, resource_id, ip_address, user_agent, metadata_json)
         )
         logger.debug("Audit log inserted successfully")
-    except Exception as e:
-        logger.error(f"Failed to log audit event: {e}")
-        logger.error(f"Traceback:\n{traceback.format_exc()}")
+    except Exception:
+        logger.exception("Failed to log audit event")
         # Don't raise - audit logging failure shouldn't break the main flow
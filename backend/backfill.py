@@ -0,0 +1,372 @@
+"""Resumable backfill jobs over every stored diagram.
+
+A job is a per-row function registered in ``JOBS``. The runner streams
+``t_diagrams`` in id order through a server-side cursor, transforms
+chunks of rows in a process pool and writes the results back with one
+batched UPDATE per chunk. Progress is checkpointed in
+``t_backfill_checkpoints`` in the same transaction as each chunk's
+UPDATE, so an interrupted run resumes after the last chunk written.
+
+Rows edited between the read and the write are skipped (their
+``updated_at`` moved on); they were written with the current code anyway.
+Backfill writes leave ``updated_at`` untouched, so they do not show up in
+the change feed.
+
+Command line usage::
+
+    python backfill.py run recodec --workers 4 --chunk-size 500 --max-active 8
+    python backfill.py run recodec --restart    # start over from the first row
+    python backfill.py status
+"""
+import argparse
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictCursor, execute_values
+
+from cache import diagram_cache
+from database import db
+from storage_codec import code_codec
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillJob:
+    """A transformation applied to every row of ``t_diagrams``.
+
+    ``select`` lists the columns ``transform`` reads (``id``, ``user_id``
+    and ``updated_at`` are always read). ``columns`` lists the
+    (column, SQL type) pairs it writes. ``transform`` takes a row dict and
+    returns a tuple of new values in ``columns`` order, or None to leave
+    the row alone. It runs in worker processes, so it must be a
+    module-level function.
+    """
+
+    def __init__(self, name, description, select, columns, transform):
+        self.name = name
+        self.description = description
+        self.select = select
+        self.columns = columns
+        self.transform = transform
+
+    @property
+    def update_sql(self):
+        assignments = ', '.join(f"{column} = v.{column}" for column, _ in self.columns)
+        names = ', '.join(column for column, _ in self.columns)
+        return f"""
+            UPDATE t_diagrams AS d
+            SET {assignments}
+            FROM (VALUES %s) AS v(id, {names}, updated_at)
+            WHERE d.id = v.id
+            AND d.updated_at IS NOT DISTINCT FROM v.updated_at
+            RETURNING d.user_id
+        """
+
+    @property
+    def template(self):
+        casts = ', '.join(f"%s::{sql_type}" for _, sql_type in self.columns)
+        return f"(%s::int, {casts}, %s::timestamp)"
+
+
+def recodec_row(row):
+    """Re-encode code with the current ``DIAGRAM_CODE_CODEC`` and newest dictionary."""
+    code = code_codec.decode_row(row)
+    stored, blob, tag = code_codec.encode(code)
+    if tag == row['code_codec']:
+        return None
+    return stored, blob, tag
+
+
+JOBS = {
+    'recodec': BackfillJob(
+        'recodec',
+        'Re-encode diagram code with the current codec settings',
+        select=['code', 'code_blob', 'code_codec'],
+        columns=[('code', 'text'), ('code_blob', 'bytea'), ('code_codec', 'varchar')],
+        transform=recodec_row
+    )
+}
+
+
+def process_chunk(job_name, rows):
+    """Transform a chunk of rows in a worker. Returns the UPDATE values."""
+    job = JOBS[job_name]
+    values = []
+    for row in rows:
+        new_values = job.transform(row)
+        if new_values is not None:
+            values.append((row['id'],) + tuple(new_values) + (row['updated_at'],))
+    return values
+
+
+class Checkpoint:
+    """Progress of one job in ``t_backfill_checkpoints``."""
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+
+    def load(self, restart=False):
+        """Return the checkpoint row, creating (or resetting) it as needed."""
+        if restart:
+            query = """
+                INSERT INTO t_backfill_checkpoints (job_name)
+                VALUES (%s)
+                ON CONFLICT (job_name) DO UPDATE
+                SET last_id = 0, rows_processed = 0, rows_updated = 0,
+                    started_at = CURRENT_TIMESTAMP, updated_at = NULL, completed_at = NULL
+                RETURNING *
+            """
+        else:
+            query = """
+                INSERT INTO t_backfill_checkpoints (job_name)
+                VALUES (%s)
+                ON CONFLICT (job_name) DO UPDATE SET job_name = EXCLUDED.job_name
+                RETURNING *
+            """
+        return db.execute_query(query, (self.job_name,), fetch_one=True)
+
+    def advance(self, cursor, last_id, processed, updated):
+        """Record a written chunk, in the caller's transaction."""
+        cursor.execute("""
+            UPDATE t_backfill_checkpoints
+            SET last_id = %s,
+                rows_processed = rows_processed + %s,
+                rows_updated = rows_updated + %s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE job_name = %s
+        """, (last_id, processed, updated, self.job_name))
+
+    def complete(self):
+        query = """
+            UPDATE t_backfill_checkpoints
+            SET completed_at = CURRENT_TIMESTAMP
+            WHERE job_name = %s
+        """
+        db.execute_query(query, (self.job_name,))
+
+
+class Progress:
+    """Logs rows/sec and ETA at most every ``interval`` seconds."""
+
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.processed = 0
+        self.updated = 0
+        self.last_id = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def add(self, processed, updated, last_id):
+        self.processed += processed
+        self.updated += updated
+        self.last_id = last_id
+        if time.monotonic() - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        now = time.monotonic()
+        self.reported = now
+        rate = self.processed / max(now - self.started, 1e-6)
+        remaining = max(self.total - self.processed, 0)
+        eta = timedelta(seconds=int(remaining / rate)) if rate else 'unknown'
+        logger.info(
+            "%d/%d rows (%d updated, last id %d), %.0f rows/s, ETA %s",
+            self.processed, self.total, self.updated, self.last_id, rate, eta
+        )
+
+
+def active_sessions():
+    """Return the number of other active sessions on the database."""
+    query = """
+        SELECT COUNT(*) AS active FROM pg_stat_activity
+        WHERE state = 'active' AND datname = current_database() AND pid <> pg_backend_pid()
+    """
+    return db.execute_query(query, fetch_one=True)['active']
+
+
+def throttle(max_active, pause):
+    """Wait until database load is under ``max_active`` sessions, then pause."""
+    backoff = max(pause, 0.5)
+    while max_active:
+        active = active_sessions()
+        if active <= max_active:
+            break
+        logger.info("Database busy (%d active sessions), backing off %.1fs", active, backoff)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+    time.sleep(pause)
+
+
+def read_chunks(conn, job, after_id, chunk_size, window_size):
+    """Yield id-ordered chunks of rows with ids above ``after_id``.
+
+    Rows come from a named (server-side) cursor. Each cursor covers at
+    most ``window_size`` rows and its transaction is then committed, so a
+    long run never holds one snapshot open (which would keep vacuum from
+    cleaning up behind it).
+    """
+    columns = ', '.join(['id', 'user_id', 'updated_at'] + job.select)
+    query = f"""
+        SELECT {columns} FROM t_diagrams
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    """
+
+    while True:
+        read = 0
+        with conn.cursor(f'backfill_{job.name}', cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query, (after_id, window_size))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                read += len(rows)
+                after_id = rows[-1]['id']
+                # bytea arrives as memoryview, which does not pickle
+                yield [
+                    {k: bytes(v) if isinstance(v, memoryview) else v for k, v in row.items()}
+                    for row in rows
+                ]
+        conn.commit()
+
+        if read < window_size:
+            return
+
+
+def write_chunk(job, checkpoint, values, last_id, processed):
+    """Apply one chunk's UPDATE and advance the checkpoint. Returns rows updated."""
+    rows = []
+    with db.get_cursor() as cursor:
+        if values:
+            rows = execute_values(
+                cursor, job.update_sql, values,
+                template=job.template, page_size=len(values), fetch=True
+            )
+        checkpoint.advance(cursor, last_id, processed, len(rows))
+
+    for user_id in {row['user_id'] for row in rows}:
+        diagram_cache.invalidate_user(user_id)
+    return len(rows)
+
+
+def run(job, workers, chunk_size, window_size, max_active, pause,
+        restart=False, report_interval=10):
+    """Run a job to completion, resuming from its checkpoint."""
+    # Also the connection the rows are read on; the lock lasts as long as it
+    conn = psycopg2.connect(**db.config)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f'backfill:{job.name}',))
+            locked = cursor.fetchone()[0]
+        conn.commit()
+        if not locked:
+            raise RuntimeError(f"Job {job.name} is already running")
+
+        checkpoint = Checkpoint(job.name)
+        state = checkpoint.load(restart=restart)
+        if state['completed_at'] and not restart:
+            logger.info("Job %s already completed at %s (use --restart to run again)",
+                        job.name, state['completed_at'])
+            return
+
+        after_id = state['last_id']
+        query = "SELECT COUNT(*) AS total FROM t_diagrams WHERE id > %s"
+        total = db.execute_query(query, (after_id,), fetch_one=True)['total']
+        logger.info("Running %s from id %d: %d rows, %d workers", job.name, after_id, total, workers)
+
+        progress = Progress(total, report_interval)
+        pending = deque()
+
+        def finish_oldest():
+            future, last_id, processed = pending.popleft()
+            values = future.result()
+            throttle(max_active, pause)
+            updated = write_chunk(job, checkpoint, values, last_id, processed)
+            progress.add(processed, updated, last_id)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            try:
+                for rows in read_chunks(conn, job, after_id, chunk_size, window_size):
+                    future = executor.submit(process_chunk, job.name, rows)
+                    pending.append((future, rows[-1]['id'], len(rows)))
+                    # Chunks are written in order, so the checkpoint never skips one
+                    if len(pending) > workers * 2:
+                        finish_oldest()
+
+                while pending:
+                    finish_oldest()
+            except BaseException:
+                for future, _, _ in pending:
+                    future.cancel()
+                raise
+    finally:
+        conn.close()
+
+    if progress.processed:
+        progress.report()
+    checkpoint.complete()
+    logger.info("Job %s complete: %d rows processed, %d updated",
+                job.name, progress.processed, progress.updated)
+
+
+def print_status():
+    """Show the checkpoint of every job that has run."""
+    query = """
+        SELECT job_name, last_id, rows_processed, rows_updated, started_at, updated_at, completed_at
+        FROM t_backfill_checkpoints
+        ORDER BY job_name
+    """
+    rows = db.execute_query(query, fetch_all=True)
+    if not rows:
+        print("No backfill jobs have run.")
+    for row in rows:
+        state = f"completed {row['completed_at']}" if row['completed_at'] else f"last write {row['updated_at']}"
+        print(f"{row['job_name']}: last id {row['last_id']}, {row['rows_processed']} processed, "
+              f"{row['rows_updated']} updated, started {row['started_at']}, {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill jobs over all stored diagrams')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run (or resume) a job')
+    run_parser.add_argument('job', choices=sorted(JOBS))
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    run_parser.add_argument('--chunk-size', type=int, default=500)
+    run_parser.add_argument('--window-size', type=int, default=50000,
+                            help='rows read per snapshot')
+    run_parser.add_argument('--max-active', type=int, default=0,
+                            help='back off while more sessions are active (0 disables)')
+    run_parser.add_argument('--pause', type=float, default=0.0,
+                            help='seconds to sleep before each write')
+    run_parser.add_argument('--report-interval', type=float, default=10)
+    run_parser.add_argument('--restart', action='store_true', help='ignore the checkpoint')
+
+    subparsers.add_parser('status', help='show job checkpoints')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    if args.command == 'run':
+        run(
+            JOBS[args.job], args.workers, args.chunk_size, args.window_size,
+            args.max_active, args.pause, restart=args.restart,
+            report_interval=args.report_interval
+        )
+    elif args.command == 'status':
+        print_status()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark diagram code compression: ratio and read/write overhead.
+
+Trains a dictionary on half of the corpus and measures the other half with
+plain zstd and with the dictionary. By default a synthetic Mermaid corpus
+is generated; ``--from-db`` samples stored diagrams instead.
+
+    python benchmarks/bench_codec.py --diagrams 2000
+    python benchmarks/bench_codec.py --from-db --diagrams 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage_codec import CODEC_ZSTD, CodeCodec  # noqa: E402
+
+WORDS = [
+    'User', 'Login', 'Validate', 'Token', 'Database', 'Cache', 'Render', 'Export',
+    'Start', 'End', 'Error', 'Retry', 'Save', 'Load', 'Request', 'Response',
+    'Order', 'Payment', 'Invoice', 'Shipping', 'Review', 'Approve', 'Reject'
+]
+
+
+def random_label(rng):
+    """Return a short human-looking node label."""
+    return ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+
+
+def flowchart(rng, size):
+    """Generate a flowchart with ``size`` edges."""
+    lines = [f"graph {rng.choice(['TD', 'LR'])}"]
+    for i in range(size):
+        a, b = rng.randrange(size), rng.randrange(size)
+        arrow = rng.choice(['-->', '---', '-.->', '==>'])
+        label = f"|{random_label(rng)}|" if rng.random() < 0.3 else ''
+        lines.append(f"    N{a}[{random_label(rng)}] {arrow}{label} N{b}({random_label(rng)})")
+    return '\n'.join(lines)
+
+
+def sequence_diagram(rng, size):
+    """Generate a sequence diagram with ``size`` messages."""
+    actors = rng.sample(WORDS, 4)
+    lines = ['sequenceDiagram'] + [f"    participant {a}" for a in actors]
+    for _ in range(size):
+        a, b = rng.sample(actors, 2)
+        lines.append(f"    {a}{rng.choice(['->>', '-->>', '-x'])}{b}: {random_label(rng)}")
+    return '\n'.join(lines)
+
+
+def synthetic_corpus(count, seed=42):
+    """Return ``count`` reproducible Mermaid sources of varied size."""
+    rng = random.Random(seed)
+    generators = [flowchart, sequence_diagram]
+    return [rng.choice(generators)(rng, int(rng.lognormvariate(3, 1)) + 2) for _ in range(count)]
+
+
+def db_corpus(count):
+    """Return up to ``count`` randomly sampled stored diagrams."""
+    from database import db
+    from storage_codec import code_codec
+
+    query = "SELECT code, code_blob, code_codec FROM t_diagrams ORDER BY random() LIMIT %s"
+    return [code_codec.decode_row(row) for row in db.execute_query(query, (count,), fetch_all=True)]
+
+
+def measure(name, codec, corpus):
+    """Encode and decode every diagram, printing size and timing."""
+    raw_bytes = sum(len(code.encode('utf-8')) for code in corpus)
+
+    start = time.perf_counter()
+    encoded = [codec.encode(code) for code in corpus]
+    encode_time = time.perf_counter() - start
+
+    stored_bytes = sum(len(blob) if blob is not None else len(code.encode('utf-8'))
+                       for code, blob, _ in encoded)
+
+    start = time.perf_counter()
+    for code, blob, tag in encoded:
+        codec.decode(code, blob, tag)
+    decode_time = time.perf_counter() - start
+
+    n = len(corpus)
+    print(f"{name:<14} ratio {raw_bytes / stored_bytes:5.2f}x  "
+          f"{raw_bytes:>10} -> {stored_bytes:>10} bytes  "
+          f"encode {encode_time / n * 1e6:7.1f} us  decode {decode_time / n * 1e6:7.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--diagrams', type=int, default=2000)
+    parser.add_argument('--dict-size', type=int, default=16384)
+    parser.add_argument('--from-db', action='store_true')
+    args = parser.parse_args()
+
+    corpus = db_corpus(args.diagrams) if args.from_db else synthetic_corpus(args.diagrams)
+    training, evaluation = corpus[::2], corpus[1::2]
+
+    plain = CodeCodec(CODEC_ZSTD)
+    plain.set_active_dictionary(None)
+
+    with_dict = CodeCodec(CODEC_ZSTD)
+    samples = [code.encode('utf-8') for code in training if len(code) <= with_dict.dict_max_size]
+    dictionary = with_dict._zstd().train_dictionary(args.dict_size, samples, level=with_dict.level)
+    with_dict.set_active_dictionary(1, dictionary.as_bytes())
+
+    sizes = sorted(len(code) for code in evaluation)
+    print(f"{len(evaluation)} diagrams, median {sizes[len(sizes) // 2]} bytes, "
+          f"dictionary {len(dictionary.as_bytes())} bytes")
+    measure('zstd', plain, evaluation)
+    measure('zstd+dict', with_dict, evaluation)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark login round trips: multi-query flow vs. single-statement LoginService.
+
+Both flows run on the current ``database.py``, so this isolates the cost
+of the extra round trips; it is not a before/after of the whole login
+path (connection pooling changed at the same time). To measure that, run
+this script's ``multi-query`` flow from a checkout of the parent commit.
+
+Requires a database initialized with schema.sql (see init_db.py). Each run
+creates throwaway users with a ``bench-login-`` google_id and removes them
+afterwards.
+
+    python benchmarks/bench_login.py --logins 500 --concurrency 8
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from auth import AuthManager, log_audit  # noqa: E402
+from database import db  # noqa: E402
+from google_auth import GoogleAuthProvider  # noqa: E402
+from login_service import LoginService  # noqa: E402
+
+GOOGLE_ID_PREFIX = 'bench-login-'
+
+app = create_app(start_background=False)
+
+
+def fake_user_info(index, run_id):
+    """Build a Google userinfo payload for a benchmark user."""
+    return {
+        'id': f"{GOOGLE_ID_PREFIX}{run_id}-{index}",
+        'email': f"bench-{run_id}-{index}@example.com",
+        'name': f"Bench User {index}",
+        'picture': ''
+    }
+
+
+def multi_query_login(user_info):
+    """Statement-per-step flow: SELECT + UPDATE/INSERT, then session, refresh token and audit INSERTs."""
+    with app.test_request_context('/api/auth/google/verify', method='POST'):
+        auth_manager = AuthManager()
+        user = GoogleAuthProvider().find_or_create_user(user_info)
+        auth_manager.generate_access_token(user['id'], user['email'])
+        auth_manager.generate_refresh_token(user['id'])
+        log_audit('login', metadata={'method': 'benchmark'})
+
+
+def single_query_login(user_info):
+    """Single-statement flow used by the auth routes."""
+    with app.test_request_context('/api/auth/google/verify', method='POST'):
+        LoginService().login(user_info, method='benchmark')
+
+
+def run(name, login, logins, concurrency, users):
+    """Time ``logins`` logins spread over ``users`` distinct accounts."""
+    run_id = uuid.uuid4().hex[:8]
+    payloads = [fake_user_info(i % users, run_id) for i in range(logins)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(login, payloads))
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<12} {logins} logins in {elapsed:.2f}s "
+          f"-> {logins / elapsed:.1f} logins/s, {elapsed / logins * 1000:.2f} ms/login")
+
+
+def cleanup():
+    """Remove benchmark users and their audit records."""
+    db.execute_query("DELETE FROM t_audit_logs WHERE metadata->>'method' = 'benchmark'")
+    db.execute_query("DELETE FROM t_users WHERE google_id LIKE %s", (GOOGLE_ID_PREFIX + '%',))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=100,
+                        help='distinct accounts; repeated logins exercise the update path')
+    args = parser.parse_args()
+
+    try:
+        run('multi-query', multi_query_login, args.logins, args.concurrency, args.users)
+        run('single-query', single_query_login, args.logins, args.concurrency, args.users)
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark cold worker startup.
+
+Each run starts a fresh interpreter, imports the app module and builds the
+app with create_app(), reporting wall time and whether the Google auth
+stack was imported. No database connection is made.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app(start_background=False)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'modules': len(sys.modules),
+    'google_auth_loaded': 'google.oauth2.id_token' in sys.modules,
+    'requests_loaded': 'requests' in sys.modules
+}))
+"""
+
+
+def run_once():
+    """Start one interpreter and return the probe's measurements."""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    timings = [r['seconds'] * 1000 for r in results]
+
+    print(f"create_app() cold start over {args.runs} runs: "
+          f"median {statistics.median(timings):.1f} ms, "
+          f"min {min(timings):.1f} ms, max {max(timings):.1f} ms")
+    print(f"modules loaded: {results[-1]['modules']}, "
+          f"google-auth loaded: {results[-1]['google_auth_loaded']}, "
+          f"requests loaded: {results[-1]['requests_loaded']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Two-level cache for diagram reads.
+
+Reads go through a per-process LRU in front of a shared cache (Redis, or
+an in-process stand-in for single-process development). Every key embeds
+the owning user's cache version; writes replace the version, so entries
+cached before a write can never be served after it. A version missing
+from the shared cache (evicted, Redis restarted) is replaced by a fresh
+random token, never reset to an old value.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRU:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a cached value or None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry if full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a value if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Remove all values whose (string) key starts with ``prefix``."""
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        """Remove all values."""
+        with self._lock:
+            self._data.clear()
+
+
+class LocalSharedCache:
+    """In-process stand-in for the shared cache.
+
+    Only correct when a single process serves all requests: other workers
+    never see its invalidations.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._lru = LocalLRU(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._lru.get(key)
+
+    def set(self, key, value, ttl):
+        self._lru.set(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        """Store a value only if the key is absent. Returns True if stored."""
+        with self._lock:
+            if self._lru.get(key) is not None:
+                return False
+            self._lru.set(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        self._lru.delete(key)
+
+
+class RedisSharedCache:
+    """Shared cache backed by any Redis-protocol server."""
+
+    def __init__(self, url, prefix='mermaid:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl))
+
+    def add(self, key, value, ttl):
+        """Store a value only if the key is absent. Returns True if stored."""
+        return bool(self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl), nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class DiagramCache:
+    """Versioned read-through cache for per-user diagram payloads.
+
+    On a miss only one loader runs per key: concurrent callers in the same
+    process wait on a lock, and other processes wait (briefly) for the
+    winner to fill the shared cache, guarded by a short-lived shared lock.
+
+    After a shared cache error, reads skip the cache for ``cooldown``
+    seconds so an outage costs one timeout, not one per request.
+
+    ``namespace`` separates instances sharing one backend. Entries are
+    grouped by a version scope - a user id for diagrams, a share token
+    for public links - and ``invalidate`` drops a whole scope at once.
+    """
+
+    def __init__(self, shared=None, local=None, namespace='diagram', ttl=None):
+        self.shared = shared
+        self.local = local or LocalLRU(
+            maxsize=int(os.getenv('DIAGRAM_CACHE_LOCAL_SIZE', 1024)),
+            ttl=float(os.getenv('DIAGRAM_CACHE_LOCAL_TTL', 30))
+        )
+        self.namespace = namespace
+        self.ttl = ttl or int(os.getenv('DIAGRAM_CACHE_TTL', 300))
+        self.version_ttl = 7 * 24 * 3600
+        self.lock_ttl = 5
+        self.lock_wait = 2.0
+        self.cooldown = float(os.getenv('DIAGRAM_CACHE_COOLDOWN', 5))
+        self._down_until = 0.0
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.shared is not None
+
+    @property
+    def available(self):
+        """False while cooling down after a shared cache error."""
+        return self.enabled and time.monotonic() >= self._down_until
+
+    def _mark_down(self, message, *args):
+        self._down_until = time.monotonic() + self.cooldown
+        logger.warning(message + "; skipping the cache for %ss", *args, self.cooldown, exc_info=True)
+
+    def _version(self, scope):
+        """Return the scope's current cache version, creating one if missing."""
+        key = f"{self.namespace}:version:{scope}"
+        version = self.shared.get(key)
+        if version is None:
+            self.shared.add(key, uuid.uuid4().hex, self.version_ttl)
+            version = self.shared.get(key)
+        return version
+
+    def _acquire_key_lock(self, key):
+        """Return the in-process lock serializing loads of ``key``.
+
+        Locks are reference counted and dropped once nobody waits on them.
+        """
+        with self._key_locks_guard:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _release_key_lock(self, key):
+        with self._key_locks_guard:
+            entry = self._key_locks[key]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._key_locks[key]
+
+    def _cached(self, key):
+        """Look a key up in the local, then the shared cache."""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        value = self.shared.get(key)
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    def get_or_load(self, scope, name, loader):
+        """Return the cached value of ``name`` in a scope, loading it on a miss.
+
+        ``loader`` must return a JSON-serializable value, or None for
+        values that must not be cached (e.g. not found).
+        """
+        if not self.available:
+            return loader()
+
+        try:
+            key = f"{self.namespace}:{scope}:{self._version(scope)}:{name}"
+            value = self._cached(key)
+        except Exception:
+            self._mark_down("Shared cache unavailable, reading from database")
+            return loader()
+
+        if value is not None:
+            return value
+
+        lock = self._acquire_key_lock(key)
+        try:
+            with lock:
+                return self._load(key, loader)
+        finally:
+            self._release_key_lock(key)
+
+    def _load(self, key, loader):
+        """Fill ``key`` from ``loader`` unless another process beats us to it.
+
+        Shared cache errors fall back to ``loader`` so an outage never
+        fails a read.
+        """
+        lock_key = f"lock:{key}"
+        try:
+            value = self._cached(key)
+            if value is not None:
+                return value
+
+            locked = self.shared.add(lock_key, 1, self.lock_ttl)
+            if not locked:
+                deadline = time.monotonic() + self.lock_wait
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    value = self._cached(key)
+                    if value is not None:
+                        return value
+        except Exception:
+            self._mark_down("Shared cache unavailable, reading from database")
+            return loader()
+
+        try:
+            value = loader()
+        finally:
+            if locked:
+                try:
+                    self.shared.delete(lock_key)
+                except Exception:
+                    self._mark_down("Failed to release shared cache lock %s", lock_key)
+
+        if value is not None:
+            self.local.set(key, value)
+            try:
+                self.shared.set(key, value, self.ttl)
+            except Exception:
+                self._mark_down("Failed to fill shared cache for %s", key)
+        return value
+
+    def invalidate(self, scope):
+        """Make every cached entry of a scope unreachable.
+
+        Call after the write has committed. The version bump is attempted
+        even during a cooldown: skipping it would leave entries cached
+        before the write reachable once the shared cache is back.
+        """
+        if not self.enabled:
+            return
+
+        # Local entries go first: if the version bump fails, at least this
+        # process stops serving them
+        self.local.delete_prefix(f"{self.namespace}:{scope}:")
+        try:
+            self.shared.set(f"{self.namespace}:version:{scope}", uuid.uuid4().hex, self.version_ttl)
+        except Exception:
+            self._mark_down(
+                "Failed to invalidate %s cache for %s; other processes may serve stale entries for up to %ss",
+                self.namespace, scope, self.ttl
+            )
+
+    def invalidate_user(self, user_id):
+        """Make every cached diagram entry of a user unreachable."""
+        self.invalidate(user_id)
+
+
+def _build_shared_cache():
+    """Create the shared cache configured by ``DIAGRAM_CACHE_BACKEND``."""
+    redis_url = os.getenv('REDIS_URL')
+    backend = os.getenv('DIAGRAM_CACHE_BACKEND', 'redis' if redis_url else 'none').lower()
+
+    if backend == 'redis':
+        return RedisSharedCache(redis_url or 'redis://localhost:6379/0')
+    if backend == 'local':
+        return LocalSharedCache()
+    return None
+
+
+# Global diagram cache instance
+diagram_cache = DiagramCache(_build_shared_cache())
+
+# Global public share cache instance, scoped by share token instead of user.
+# Uses the same backend as diagram_cache: a per-process copy would keep
+# serving a revoked link from other workers, so without one public reads
+# go to the database.
+share_cache = DiagramCache(
+    diagram_cache.shared,
+    namespace='share',
+    ttl=int(os.getenv('PUBLIC_SHARE_CACHE_TTL', 60))
+)
@@ -0,0 +1,116 @@
+"""Postgres LISTEN/NOTIFY bridge for the diagram change feed."""
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeListener:
+    """Wakes long-polling requests when a user's diagrams change.
+
+    A single background thread per process holds a dedicated connection
+    that LISTENs on the ``diagram_changes`` channel (see the
+    ``notify_diagram_change`` trigger in schema.sql). Every notification
+    bumps an in-memory counter for the user, and waiters block on a
+    condition variable until their counter moves.
+    """
+
+    channel = 'diagram_changes'
+
+    def __init__(self, poll_interval=5):
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._versions = {}
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the listener thread on first use in this process."""
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='diagram-change-listener',
+                daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        """Listen for notifications forever, reconnecting with backoff."""
+        backoff = 1
+
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**db.config)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                logger.info("Listening for diagram changes on channel %s", self.channel)
+                backoff = 1
+
+                while True:
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+
+                    conn.poll()
+                    user_ids = set()
+                    while conn.notifies:
+                        user_ids.add(conn.notifies.pop(0).payload)
+
+                    if user_ids:
+                        self._publish(user_ids)
+
+            except Exception:
+                logger.exception("Diagram change listener failed, retrying in %ss", backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if conn:
+                    conn.close()
+
+    def _publish(self, user_ids):
+        """Bump the counters of the given users and wake their waiters."""
+        with self._condition:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    def snapshot(self, user_id):
+        """Return the current change counter for a user.
+
+        Take the snapshot *before* querying the database and pass it to
+        :meth:`wait`, so a change committed in between is not missed.
+        """
+        self._ensure_started()
+        with self._condition:
+            return self._versions.get(str(user_id), 0)
+
+    def wait(self, user_id, snapshot, timeout):
+        """Block until the user's counter moves past ``snapshot``.
+
+        Returns True if a change was notified, False on timeout.
+        """
+        self._ensure_started()
+        key = str(user_id)
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._versions.get(key, 0) != snapshot,
+                timeout
+            )
+
+
+# Global change listener instance
+change_listener = ChangeListener()
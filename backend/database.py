@@ -1,15 +1,28 @@
 """Database connection and query utilities."""
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from contextlib import contextmanager
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
 class Database:
-    """Database connection manager."""
+    """Database connection manager.
+
+    Connections come from a thread-safe pool that is created lazily and
+    tied to the process that created it. After a fork (gunicorn
+    ``--preload``) the child builds its own pool on first use instead of
+    sharing the parent's sockets.
+
+    ``ThreadedConnectionPool`` raises as soon as it is exhausted, so
+    checkouts first take one of ``pool_max`` semaphore slots: a burst of
+    requests waits up to ``DB_POOL_TIMEOUT`` seconds for a connection
+    instead of failing.
+    """
 
     def __init__(self):
         self.config = {
@@ -20,22 +33,96 @@ class Database:
             'password': os.getenv('DB_PASSWORD', ''),
             'options': f"-c search_path={os.getenv('DB_SCHEMA', 'public')}"
         }
+        self.pool_min = int(os.getenv('DB_POOL_MIN', 1))
+        self.pool_max = int(os.getenv('DB_POOL_MAX', 10))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', 10))
+        self._pool = None
+        self._slots = None
+        self._in_use = 0
+        self._in_use_lock = threading.Lock()
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        # Pools inherited across fork. They are kept referenced so their
+        # connections are never closed (and terminated server-side) from
+        # the child while the parent still uses them.
+        self._inherited_pools = []
+
+    def get_pool(self):
+        """Return this process's connection pool, creating it on first use."""
+        pid = os.getpid()
+        if self._pool is not None and self._pool_pid == pid:
+            return self._pool
+
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != pid:
+                if self._pool is not None:
+                    self._inherited_pools.append(self._pool)
+                self._pool = ThreadedConnectionPool(self.pool_min, self.pool_max, **self.config)
+                self._slots = threading.BoundedSemaphore(self.pool_max)
+                self._in_use = 0
+                self._pool_pid = pid
+
+        return self._pool
+
+    def close_pool(self):
+        """Close all pooled connections owned by this process."""
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+            self._pool_pid = None
+
+    def pool_stats(self):
+        """Return connection counts of this process's pool."""
+        self.get_pool()
+        return {
+            'in_use': self._in_use,
+            'max': self.pool_max
+        }
+
+    def _count_checkout(self, delta):
+        with self._in_use_lock:
+            self._in_use += delta
+
+    def connect_readonly(self):
+        """Open a dedicated read-only connection for long-running reads.
+
+        Connects to ``DB_REPLICA_HOST``/``DB_REPLICA_PORT`` when set, so
+        exports stay off the primary, and never ties up a pooled
+        connection. The caller closes it.
+        """
+        config = dict(
+            self.config,
+            host=os.getenv('DB_REPLICA_HOST') or self.config['host'],
+            port=os.getenv('DB_REPLICA_PORT') or self.config['port']
+        )
+        conn = psycopg2.connect(**config)
+        conn.set_session(readonly=True)
+        return conn
 
     @contextmanager
     def get_connection(self):
         """Get a database connection context manager."""
+        pool = self.get_pool()
+        slots = self._slots
+        if not slots.acquire(timeout=self.pool_timeout):
+            raise PoolError('Timed out waiting for a database connection')
+
+        self._count_checkout(1)
         conn = None
         try:
-            conn = psycopg2.connect(**self.config)
+            conn = pool.getconn()
             yield conn
             conn.commit()
         except Exception as e:
-            if conn:
+            if conn and not conn.closed:
                 conn.rollback()
             raise e
         finally:
             if conn:
-                conn.close()
+                pool.putconn(conn, close=bool(conn.closed))
+            self._count_checkout(-1)
+            slots.release()
 
     @contextmanager
     def get_cursor(self, cursor_factory=RealDictCursor):
@@ -1,13 +1,15 @@
 """Google OAuth 2.0 authentication."""
 import os
-import requests
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
+from functools import lru_cache
 from database import db
 
 
 class GoogleAuthProvider:
-    """Handles Google OAuth 2.0 authentication."""
+    """Handles Google OAuth 2.0 authentication.
+
+    requests and the google-auth libraries are imported on first use so
+    they are not loaded (together with cryptography) at worker startup.
+    """
 
     def __init__(self):
         self.client_id = os.getenv('GOOGLE_CLIENT_ID')
@@ -35,6 +37,8 @@ class GoogleAuthProvider:
 
     def exchange_code_for_token(self, code):
         """Exchange authorization code for access token."""
+        import requests
+
         data = {
             'code': code,
             'client_id': self.client_id,
@@ -49,6 +53,9 @@ class GoogleAuthProvider:
 
     def verify_id_token(self, token):
         """Verify Google ID token."""
+        from google.oauth2 import id_token
+        from google.auth.transport import requests as google_requests
+
         try:
             id_info = id_token.verify_oauth2_token(
                 token,
@@ -61,6 +68,8 @@ class GoogleAuthProvider:
 
     def get_user_info(self, access_token):
         """Get user info from Google."""
+        import requests
+
         headers = {'Authorization': f'Bearer {access_token}'}
         response = requests.get(self.userinfo_url, headers=headers)
         response.raise_for_status()
@@ -108,3 +117,9 @@ class GoogleAuthProvider:
             )
 
         return user
+
+
+@lru_cache(maxsize=None)
+def get_google_auth():
+    """Return the shared provider, created on first use."""
+    return GoogleAuthProvider()
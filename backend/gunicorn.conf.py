@@ -0,0 +1,46 @@
+"""Gunicorn configuration.
+
+The app is imported once in the master (``preload_app``) and shared with
+workers copy-on-write, so a new worker only has to fork. Per-process state
+(DB pool, log listener, background threads) is started in ``post_fork``.
+
+On SIGTERM a worker stops accepting connections, reports not ready,
+finishes in-flight requests (up to ``graceful_timeout``) and then flushes
+its background work in ``worker_exit``.
+"""
+import os
+import signal
+
+wsgi_app = 'app:create_app(start_background=False)'
+preload_app = True
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+
+def post_fork(server, worker):
+    """Re-initialize per-process services in the new worker."""
+    from app import start_background_services
+    start_background_services()
+
+
+def post_worker_init(worker):
+    """Report not ready as soon as the worker starts shutting down."""
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        from health import health_monitor
+        health_monitor.start_draining()
+        if callable(handle_exit):
+            handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    """Flush background work after in-flight requests have finished."""
+    from app import stop_background_services
+    stop_background_services()
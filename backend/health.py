@@ -0,0 +1,116 @@
+"""Background health probes for the readiness endpoint."""
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Probes the database on a timer and caches the result.
+
+    ``/api/health/ready`` only reads the cached result, so load balancer
+    probes never add database load, however often they run. A worker is
+    ready when the last probe succeeded, was fast enough, found a free
+    pool connection and is recent, and the worker is not draining.
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv('HEALTH_PROBE_INTERVAL', 5))
+        self.max_latency_ms = float(os.getenv('HEALTH_MAX_DB_LATENCY_MS', 500))
+        # Results older than this mean the probe thread is stuck
+        self.stale_after = self.interval * 3
+        self._result = None
+        self._draining = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def probe(self):
+        """Run one probe and cache its result."""
+        result = {'checked_at': time.time()}
+
+        try:
+            result['pool'] = db.pool_stats()
+            start = time.perf_counter()
+            db.execute_query("SELECT 1")
+            result['db_latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+            if result['pool']['in_use'] >= result['pool']['max']:
+                result['error'] = 'Connection pool exhausted'
+            elif result['db_latency_ms'] > self.max_latency_ms:
+                result['error'] = 'Database latency too high'
+        except Exception as e:
+            result['error'] = str(e)
+
+        result['ok'] = 'error' not in result
+        if not result['ok']:
+            logger.warning("Health probe failed: %s", result['error'])
+
+        self._result = result
+        return result
+
+    def run_forever(self):
+        """Probe every ``interval`` seconds until stopped."""
+        while not self._stop_event.is_set():
+            self.probe()
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        """Start probing in a daemon thread (once per process)."""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        # Fresh state: anything inherited across fork describes the parent
+        self._result = None
+        self._draining = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.run_forever, name='health-monitor', daemon=True)
+        self._thread.start()
+        self._pid = os.getpid()
+
+    def stop(self, timeout=None):
+        """Stop the probe thread."""
+        self._stop_event.set()
+        if self._thread and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def start_draining(self):
+        """Report not ready from now on, e.g. once shutdown has begun."""
+        self._draining = True
+
+    def status(self):
+        """Return (ready, details) from the cached probe result."""
+        result = self._result
+
+        if self._draining:
+            reason = 'Draining'
+        elif result is None:
+            reason = 'Not probed yet'
+        elif time.time() - result['checked_at'] > self.stale_after:
+            reason = 'Probe result is stale'
+        elif not result['ok']:
+            reason = result['error']
+        else:
+            reason = None
+
+        details = {'status': 'ready' if reason is None else 'unavailable'}
+        if reason is not None:
+            details['reason'] = reason
+        if result is not None:
+            details['checked_at'] = result['checked_at']
+            details['db_latency_ms'] = result.get('db_latency_ms')
+            details['pool'] = result.get('pool')
+
+        return reason is None, details
+
+
+# Global health monitor instance
+health_monitor = HealthMonitor()
@@ -0,0 +1,271 @@
+"""Idempotency-Key support for write endpoints.
+
+A client sends the same ``Idempotency-Key`` header on every retry of one
+logical write. The first request claims the key in
+``t_idempotency_keys`` and runs; its response is stored and replayed for
+later requests with the same key, which never reach the view again.
+A concurrent duplicate waits briefly for the first to finish.
+
+Views that write call ``record_response`` on their own cursor, so the
+stored response commits in the same transaction as the write. A claim
+left unrecorded by a dead worker therefore means its write rolled back,
+and a retry may safely take the claim over and run again.
+
+Completed responses are also kept in a per-process LRU, so most replays
+skip the database.
+
+Command line usage::
+
+    python idempotency.py    # purge expired keys
+"""
+import hashlib
+import logging
+import os
+import time
+from functools import wraps
+
+from dotenv import load_dotenv
+from flask import request, jsonify, current_app, make_response, g
+
+from cache import LocalLRU
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """Claims keys and stores the responses they produced."""
+
+    def __init__(self):
+        self.ttl = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+        # A claim older than this is assumed abandoned (worker died mid-request)
+        self.lock_timeout = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+        self.wait = float(os.getenv('IDEMPOTENCY_WAIT', 10))
+        self.local = LocalLRU(
+            maxsize=int(os.getenv('IDEMPOTENCY_LOCAL_SIZE', 1024)),
+            ttl=min(self.ttl, 300)
+        )
+
+    def claim(self, user_id, key, request_hash):
+        """Claim a key for this request.
+
+        Returns ``(claimed_at, None)`` if claimed, otherwise
+        ``(None, row)`` with the stored row of the request that holds the
+        key. ``claimed_at`` identifies this claim in later updates.
+        """
+        # Retried when the holder releases the key between the two queries
+        for _ in range(3):
+            with db.get_cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO t_idempotency_keys (user_id, idempotency_key, request_hash, expires_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(secs => %s))
+                    ON CONFLICT (user_id, idempotency_key) DO UPDATE
+                    SET request_hash = EXCLUDED.request_hash,
+                        status_code = NULL,
+                        response_body = NULL,
+                        created_at = CURRENT_TIMESTAMP,
+                        expires_at = EXCLUDED.expires_at
+                    WHERE t_idempotency_keys.expires_at < CURRENT_TIMESTAMP
+                    OR (t_idempotency_keys.status_code IS NULL
+                        AND t_idempotency_keys.created_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                    RETURNING created_at
+                """, (user_id, key, request_hash, self.ttl, self.lock_timeout))
+                claimed = cursor.fetchone()
+                if claimed:
+                    return claimed['created_at'], None
+
+                cursor.execute("""
+                    SELECT request_hash, status_code, response_body
+                    FROM t_idempotency_keys
+                    WHERE user_id = %s AND idempotency_key = %s
+                """, (user_id, key))
+                row = cursor.fetchone()
+                if row is not None:
+                    return None, row
+
+        raise RuntimeError('Could not claim idempotency key')
+
+    def wait_for_response(self, user_id, key):
+        """Poll until the request holding a key has finished, or give up."""
+        deadline = time.monotonic() + self.wait
+
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            query = """
+                SELECT request_hash, status_code, response_body
+                FROM t_idempotency_keys
+                WHERE user_id = %s AND idempotency_key = %s
+            """
+            row = db.execute_query(query, (user_id, key), fetch_one=True)
+            if row is None or row['status_code'] is not None:
+                return row
+        return None
+
+    def record(self, cursor, claim, status_code, body):
+        """Store the response of a claim on the caller's cursor.
+
+        Raises RuntimeError if the claim was taken over in the meantime,
+        so the caller's write rolls back instead of landing twice.
+        """
+        cursor.execute("""
+            UPDATE t_idempotency_keys
+            SET status_code = %s, response_body = %s
+            WHERE user_id = %s AND idempotency_key = %s AND request_hash = %s
+            AND created_at = %s AND status_code IS NULL
+        """, (status_code, body, claim['user_id'], claim['key'], claim['request_hash'], claim['claimed_at']))
+        if cursor.rowcount != 1:
+            raise RuntimeError('Idempotency key claim was lost')
+
+    def complete(self, claim, status_code, body):
+        """Store the response of a claim that wrote nothing (e.g. a 404)."""
+        with db.get_cursor() as cursor:
+            self.record(cursor, claim, status_code, body)
+        self.remember(claim, status_code, body)
+
+    def remember(self, claim, status_code, body):
+        """Cache a stored response in this process."""
+        self.local.set((claim['user_id'], claim['key']), {
+            'request_hash': claim['request_hash'],
+            'status_code': status_code,
+            'response_body': body
+        })
+
+    def release(self, claim):
+        """Drop an unrecorded claim so the request can be retried (e.g. after a server error)."""
+        query = """
+            DELETE FROM t_idempotency_keys
+            WHERE user_id = %s AND idempotency_key = %s AND request_hash = %s
+            AND created_at = %s AND status_code IS NULL
+        """
+        db.execute_query(query, (claim['user_id'], claim['key'], claim['request_hash'], claim['claimed_at']))
+
+    def purge_expired(self, batch_size=1000):
+        """Delete expired keys in batches. Returns the number deleted."""
+        total = 0
+        while True:
+            query = """
+                DELETE FROM t_idempotency_keys
+                WHERE ctid IN (
+                    SELECT ctid FROM t_idempotency_keys
+                    WHERE expires_at < CURRENT_TIMESTAMP
+                    LIMIT %s
+                )
+            """
+            deleted = db.execute_query(query, (batch_size,))
+            total += deleted
+            if deleted < batch_size:
+                return total
+
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore()
+
+
+def record_response(cursor, body, status_code):
+    """Store the current request's response under its Idempotency-Key.
+
+    Call from an ``idempotent`` view that writes, on the cursor of the
+    write and as the last statement before it commits, so the write and
+    the stored response commit together. Does nothing for requests
+    without a key.
+    """
+    claim = g.get('idempotency_claim')
+    if claim is None:
+        return
+
+    payload = current_app.json.dumps(body)
+    idempotency_store.record(cursor, claim, status_code, payload)
+    claim['response'] = (status_code, payload)
+
+
+def _replay(row):
+    """Rebuild a stored response."""
+    response = current_app.response_class(
+        row['response_body'], status=row['status_code'], mimetype='application/json'
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _stored_response(row, request_hash):
+    """Return the response for a key held by another request."""
+    if row['request_hash'] != request_hash:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    if row['status_code'] is None:
+        return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+    return _replay(row)
+
+
+def idempotent(f):
+    """Replay the stored response for a repeated ``Idempotency-Key``.
+
+    Apply below ``require_auth``: keys are scoped to the user. Requests
+    without the header run normally. Views that write must call
+    ``record_response`` inside their write transaction. Otherwise the
+    response is stored after the view returns, and server errors release
+    the key so the client can retry.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = request.user_id
+        request_hash = hashlib.sha256(
+            f"{request.method} {request.path}\n".encode('utf-8') + request.get_data()
+        ).hexdigest()
+
+        cached = idempotency_store.local.get((user_id, key))
+        if cached is not None:
+            return _stored_response(cached, request_hash)
+
+        try:
+            claimed_at, row = idempotency_store.claim(user_id, key, request_hash)
+            if row is not None:
+                if row['status_code'] is None and row['request_hash'] == request_hash:
+                    row = idempotency_store.wait_for_response(user_id, key) or row
+                return _stored_response(row, request_hash)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+        claim = g.idempotency_claim = {
+            'user_id': user_id,
+            'key': key,
+            'request_hash': request_hash,
+            'claimed_at': claimed_at
+        }
+        response = None
+        try:
+            response = make_response(f(*args, **kwargs))
+        finally:
+            try:
+                if response is not None and response.status_code < 500:
+                    if 'response' in claim:
+                        idempotency_store.remember(claim, *claim['response'])
+                    else:
+                        idempotency_store.complete(
+                            claim, response.status_code, response.get_data(as_text=True)
+                        )
+                else:
+                    # Deletes nothing if the response committed with the write
+                    idempotency_store.release(claim)
+            except Exception:
+                logger.exception("Failed to record idempotency key")
+
+        return response
+
+    return decorated_function
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    print(f"Purged {idempotency_store.purge_expired()} expired idempotency keys.")
@@ -0,0 +1,240 @@
+"""Non-blocking structured logging."""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s]: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# Queue handler installed on the root logger, the handler doing the actual
+# I/O and the listener thread feeding it
+_queue_handler = None
+_target_handler = None
+_listener = None
+_listener_pid = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request ID to every record.
+
+    Runs on the calling thread, while the request context is still
+    available, so the ID survives the hand-off to the queue listener.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as single-line JSON objects.
+
+    Fields passed through ``extra=`` are included as top-level keys.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-')
+        }
+
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that defers all formatting to the listener thread.
+
+    The stock ``QueueHandler.prepare`` formats the message on the calling
+    thread so records can be pickled; the queue here is in-process, so the
+    record is enqueued as-is. When the queue is full the record is dropped
+    rather than blocking the request; the next record that fits is
+    followed by a warning with the number dropped.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+
+        if self.dropped > self._reported:
+            self._report_dropped()
+
+    def _report_dropped(self):
+        """Log how many records were dropped since the last report."""
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            "Log queue full: dropped %d records (%d since start)",
+            (self.dropped - self._reported, self.dropped), None
+        )
+        record.request_id = '-'
+        try:
+            self.queue.put_nowait(record)
+            self._reported = self.dropped
+        except queue.Full:
+            pass
+
+
+def _parse_sample_rates(value):
+    """Parse ``endpoint=rate`` pairs, e.g. ``diagrams.get_diagrams=0.1``."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        endpoint, _, rate = item.partition('=')
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+def _build_target_handler(debug):
+    """Build the handler that performs the actual (blocking) I/O."""
+    if debug:
+        handler = logging.StreamHandler()
+    else:
+        log_file = os.getenv('LOG_FILE', 'logs/mermaid-editor.log')
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        # Rotate at 10MB, keep 10 backup files
+        handler = RotatingFileHandler(log_file, maxBytes=10240000, backupCount=10)
+
+    if os.getenv('LOG_FORMAT', 'text' if debug else 'json').lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    return handler
+
+
+def _start_listener():
+    """Point the queue handler at a fresh queue drained by a new listener thread."""
+    global _listener, _listener_pid
+
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+    _queue_handler.queue = log_queue
+
+    _listener = QueueListener(log_queue, _target_handler, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+def dropped_log_records():
+    """Return the number of log records dropped because the queue was full."""
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def stop_log_listener():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+
+    if _listener and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener = None
+
+
+def ensure_log_listener():
+    """Restart the listener thread in a forked child process.
+
+    Threads do not survive fork and the inherited queue may have been
+    locked mid-operation, so the child gets its own queue and listener.
+    Records still queued in the parent at fork time stay with the parent.
+    """
+    if _target_handler is None or (_listener and _listener_pid == os.getpid()):
+        return
+
+    _start_listener()
+
+
+def configure_logging(app):
+    """Route all logging through a background queue listener.
+
+    Request threads only enqueue records; formatting, file writes and
+    rotation happen on the listener thread. Also installs request ID
+    tracking and sampled JSON access logs.
+    """
+    level = os.getenv('LOG_LEVEL', 'DEBUG' if app.debug else 'INFO').upper()
+
+    global _queue_handler, _target_handler
+
+    stop_log_listener()
+    _queue_handler = NonBlockingQueueHandler(None)
+    _queue_handler.addFilter(RequestContextFilter())
+    _target_handler = _build_target_handler(app.debug)
+    _start_listener()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    # Let app.logger propagate to the queue instead of writing to stderr itself
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(level)
+
+    access_logger = logging.getLogger('mermaid_editor.access')
+    default_rate = float(os.getenv('LOG_ACCESS_SAMPLE_RATE', 1.0))
+    sample_rates = _parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', ''))
+
+    @app.before_request
+    def start_request_timer():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+
+        start = g.get('request_start')
+        if start is None:
+            return response
+
+        rate = sample_rates.get(request.endpoint, default_rate)
+        if response.status_code < 500 and random.random() >= rate:
+            return response
+
+        access_logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+                'sample_rate': rate
+            }
+        )
+        return response
+
+
+atexit.register(stop_log_listener)
@@ -0,0 +1,88 @@
+"""Single round-trip login pipeline."""
+import json
+from functools import lru_cache
+from flask import request
+from auth import get_auth_manager
+from database import db
+
+
+class LoginService:
+    """Logs a Google user in with one database statement.
+
+    The user upsert, the session and refresh token rows and the login
+    audit record are written by a single data-modifying CTE, so a login
+    costs one round trip and one transaction instead of five or more
+    sequential queries on separate connections.
+    """
+
+    login_query = """
+        WITH upserted_user AS (
+            INSERT INTO t_users (google_id, email, display_name, photo_url, last_login)
+            VALUES (%(google_id)s, %(email)s, %(display_name)s, %(photo_url)s, CURRENT_TIMESTAMP)
+            ON CONFLICT (google_id) DO UPDATE
+            SET last_login = CURRENT_TIMESTAMP,
+                display_name = EXCLUDED.display_name,
+                photo_url = EXCLUDED.photo_url,
+                email = EXCLUDED.email,
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING id, email, display_name, photo_url
+        ),
+        new_session AS (
+            INSERT INTO t_sessions (user_id, token_jti, expires_at, ip_address, user_agent)
+            SELECT id, %(jti)s, %(access_expires_at)s, %(ip_address)s, %(user_agent)s
+            FROM upserted_user
+        ),
+        new_refresh_token AS (
+            INSERT INTO t_refresh_tokens (user_id, token_hash, expires_at)
+            SELECT id, %(refresh_token_hash)s, %(refresh_expires_at)s
+            FROM upserted_user
+        ),
+        audit AS (
+            INSERT INTO t_audit_logs (user_id, action, ip_address, user_agent, metadata)
+            SELECT id, 'login', %(ip_address)s, %(user_agent)s, %(metadata)s
+            FROM upserted_user
+        )
+        SELECT id, email, display_name, photo_url FROM upserted_user
+    """
+
+    def __init__(self, auth_manager=None):
+        self.auth_manager = auth_manager or get_auth_manager()
+
+    def login(self, google_user_info, method='google_oauth'):
+        """Upsert the user and issue tokens.
+
+        ``google_user_info`` may be either the userinfo endpoint response
+        (``id``) or verified ID token claims (``sub``).
+
+        Returns a tuple of (user, access_token, refresh_token).
+        """
+        jti, access_expires_at = self.auth_manager.new_access_token_id()
+        refresh_token, refresh_token_hash, refresh_expires_at = self.auth_manager.new_refresh_token()
+
+        params = {
+            'google_id': google_user_info.get('id') or google_user_info['sub'],
+            'email': google_user_info['email'],
+            'display_name': google_user_info.get('name', ''),
+            'photo_url': google_user_info.get('picture', ''),
+            'jti': jti,
+            'access_expires_at': access_expires_at,
+            'refresh_token_hash': refresh_token_hash,
+            'refresh_expires_at': refresh_expires_at,
+            'ip_address': request.remote_addr if request else None,
+            'user_agent': request.headers.get('User-Agent') if request else None,
+            'metadata': json.dumps({'method': method})
+        }
+
+        user = db.execute_query(self.login_query, params, fetch_one=True)
+
+        access_token = self.auth_manager.encode_access_token(
+            user['id'], user['email'], jti, access_expires_at
+        )
+
+        return user, access_token, refresh_token
+
+
+@lru_cache(maxsize=None)
+def get_login_service():
+    """Return the shared login service, created on first use."""
+    return LoginService()
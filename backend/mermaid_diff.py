@@ -0,0 +1,323 @@
+"""Semantic diff of Mermaid diagrams.
+
+Flowcharts (``graph`` / ``flowchart``) are parsed into nodes and edges and
+compared as keyed sets, so the cost is linear in the size of the diagrams
+and independent of statement order. Other diagram types, and flowcharts
+the parser does not understand, fall back to a line diff.
+
+Parses are cached per process, keyed by a hash of the code, so diffing
+one diagram against several others parses it once.
+"""
+import difflib
+import hashlib
+import os
+import re
+from collections import Counter
+
+from cache import LocalLRU
+
+_parse_cache = LocalLRU(
+    maxsize=int(os.getenv('MERMAID_PARSE_CACHE_SIZE', 256)),
+    ttl=3600
+)
+
+_HEADER_RE = re.compile(r'^(?:graph|flowchart)\b', re.I)
+
+# Statements that style or group nodes but define none
+_IGNORED_KEYWORDS = {
+    'subgraph', 'end', 'direction', 'classdef', 'class', 'style',
+    'linkstyle', 'click', 'acctitle', 'accdescr'
+}
+
+# Node shapes as (opening, closings), longest opening first
+_SHAPES = [
+    ('(((', (')))',)), ('([', ('])',)), ('[[', (']]',)), ('[(', (')]',)),
+    ('((', ('))',)), ('{{', ('}}',)), ('[/', ('/]', '\\]')), ('[\\', ('\\]', '/]')),
+    ('[', (']',)), ('(', (')',)), ('{', ('}',)), ('>', (']',))
+]
+_SHAPE_STARTS = frozenset(opening[0] for opening, _ in _SHAPES)
+
+_NODE_ID_RE = re.compile(r'\s*([\w$]+)')
+_CLASS_SUFFIX_RE = re.compile(r':::[\w-]+')
+_AMPERSAND_RE = re.compile(r'\s*&')
+_LINK_RE = re.compile(r"""
+    \s*
+    (?:
+        # A -- text --> B, A -. text .-> B, A == text ==> B, also without
+        # spaces (A--text-->B) and with a pipe label (A -- text -->|x| B).
+        # Unspaced text may not start like the rest of an arrow (A --> B,
+        # A --o B), which the next branch handles, and no text may contain
+        # another link opener (A -- a -- b --> C).
+        (?P<open>[<ox]?(?:--|==|-\.))
+        (?:\s+|(?![-=.>\s]|[ox](?![\w$])))
+        (?P<text>(?:(?!--|==|-\.)[^|])+?)\s*
+        (?P<close>\.-+[>ox]?|-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,})
+        (?:\s*\|(?P<text_label>[^|]*)\|)?
+      |
+        # A --> B, A -->|text| B. A bare -- or == is not a link.
+        (?P<arrow>[<ox]?(?:-{2,}[>ox]|-{3,}|={2,}[>ox]|={3,}|-\.+-[>ox]?|~{3,}))
+        (?:\s*\|(?P<label>[^|]*)\|)?
+    )
+""", re.X)
+
+
+def _clean_label(text):
+    """Strip whitespace and surrounding quotes from a label."""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        text = text[1:-1]
+    return text.strip()
+
+
+def _link_kind(open_part, close_part):
+    """Normalize a link to its style and arrow heads, ignoring its length."""
+    left = open_part[0] if open_part[:1] in ('<', 'o', 'x') else ''
+    right = close_part[-1] if close_part[-1:] in ('>', 'o', 'x') else ''
+    body = open_part + close_part
+
+    if '~' in body:
+        style = 'invisible'
+    elif '.' in body:
+        style = 'dotted'
+    elif '=' in body:
+        style = 'thick'
+    else:
+        style = 'solid'
+    return f"{left}{style}{right}"
+
+
+def _parse_node(statement, pos):
+    """Parse one node reference at ``pos``.
+
+    Returns (node_id, label, shape, end) or None. ``label`` and ``shape``
+    are None when the reference carries no shape.
+    """
+    match = _NODE_ID_RE.match(statement, pos)
+    if not match:
+        return None
+
+    node_id = match.group(1)
+    pos = match.end()
+    shapes = _SHAPES if statement[pos:pos + 1] in _SHAPE_STARTS else ()
+
+    for opening, closings in shapes:
+        if not statement.startswith(opening, pos):
+            continue
+
+        start = pos + len(opening)
+        search_from = start
+        # Quoted labels may contain closing brackets
+        if statement.startswith('"', start):
+            quote_end = statement.find('"', start + 1)
+            if quote_end != -1:
+                search_from = quote_end + 1
+
+        ends = [(statement.find(c, search_from), c) for c in closings]
+        ends = [(index, c) for index, c in ends if index != -1]
+        if not ends:
+            return None
+
+        end, closing = min(ends)
+        label = _clean_label(statement[start:end])
+        pos = end + len(closing)
+        class_match = _CLASS_SUFFIX_RE.match(statement, pos)
+        if class_match:
+            pos = class_match.end()
+        return node_id, label, opening, pos
+
+    class_match = _CLASS_SUFFIX_RE.match(statement, pos)
+    if class_match:
+        pos = class_match.end()
+    return node_id, None, None, pos
+
+
+def _parse_statement(statement, nodes, edges, edge_counts):
+    """Add the nodes and edges of one statement. Returns False if not understood."""
+    groups = []
+    links = []
+    pos = 0
+
+    while True:
+        group = []
+        while True:
+            node = _parse_node(statement, pos)
+            if node is None:
+                return False
+            group.append(node)
+            pos = node[3]
+
+            ampersand = _AMPERSAND_RE.match(statement, pos)
+            if not ampersand:
+                break
+            pos = ampersand.end()
+        groups.append(group)
+
+        link = _LINK_RE.match(statement, pos)
+        if not link:
+            break
+
+        if link.group('arrow'):
+            kind = _link_kind(link.group('arrow'), link.group('arrow'))
+            label = _clean_label(link.group('label') or '')
+        else:
+            kind = _link_kind(link.group('open'), link.group('close'))
+            label = _clean_label(link.group('text'))
+            if link.group('text_label'):
+                label = f"{label} {_clean_label(link.group('text_label'))}"
+        links.append((kind, label))
+        pos = link.end()
+
+    if statement[pos:].strip():
+        return False
+
+    for group in groups:
+        for node_id, label, shape, _ in group:
+            if label is not None or node_id not in nodes:
+                nodes[node_id] = (label if label is not None else node_id, shape)
+
+    for (kind, label), sources, targets in zip(links, groups, groups[1:]):
+        for source in sources:
+            for target in targets:
+                # Repeated identical links are told apart by occurrence
+                base = (source[0], target[0], kind)
+                occurrence = edge_counts[base]
+                edge_counts[base] += 1
+                edges[base + (occurrence,)] = label
+
+    return True
+
+
+def _split_statements(line):
+    """Split a line on semicolons outside double quotes."""
+    if ';' not in line:
+        return [line] if line else []
+
+    statements = []
+    current = []
+    quoted = False
+
+    for char in line:
+        if char == '"':
+            quoted = not quoted
+        elif char == ';' and not quoted:
+            statements.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+
+    statements.append(''.join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+def _code_lines(code):
+    """Return the meaningful lines of a diagram, without front matter and comments."""
+    lines = code.splitlines()
+    if lines and lines[0].strip() == '---':
+        for index in range(1, len(lines)):
+            if lines[index].strip() == '---':
+                lines = lines[index + 1:]
+                break
+
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('%%')]
+
+
+def parse_flowchart(code):
+    """Parse flowchart code into nodes and edges.
+
+    Returns a dict with ``nodes`` ({id: (label, shape)}), ``edges``
+    ({(source, target, kind, occurrence): label}) and ``other`` (a Counter
+    of statements that are not nodes or edges), or None when the code is
+    not a flowchart.
+    """
+    lines = _code_lines(code)
+    if not lines or not _HEADER_RE.match(lines[0]):
+        return None
+
+    nodes = {}
+    edges = {}
+    edge_counts = Counter()
+    other = Counter()
+
+    header, _, rest = lines[0].partition(';')
+    for line in [rest] + lines[1:]:
+        for statement in _split_statements(line):
+            keyword = statement.split(None, 1)[0].lower()
+            if keyword in _IGNORED_KEYWORDS or not _parse_statement(statement, nodes, edges, edge_counts):
+                other[statement] += 1
+
+    return {'nodes': nodes, 'edges': edges, 'other': other}
+
+
+def parse_cached(code):
+    """Parse flowchart code, reusing the result for identical code."""
+    key = hashlib.sha256(code.encode('utf-8')).hexdigest()
+    parsed = _parse_cache.get(key)
+    if parsed is None:
+        parsed = parse_flowchart(code) or False
+        _parse_cache.set(key, parsed)
+    return parsed or None
+
+
+def _node_json(node_id, node):
+    return {'id': node_id, 'label': node[0], 'shape': node[1]}
+
+
+def _edge_json(key, label):
+    return {'from': key[0], 'to': key[1], 'kind': key[2], 'label': label}
+
+
+def _diff_nodes(before, after):
+    """Diff two node maps by id."""
+    return {
+        'added': [_node_json(i, after[i]) for i in sorted(after.keys() - before.keys())],
+        'removed': [_node_json(i, before[i]) for i in sorted(before.keys() - after.keys())],
+        'changed': [
+            {'id': i, 'before': _node_json(i, before[i]), 'after': _node_json(i, after[i])}
+            for i in sorted(before.keys() & after.keys()) if before[i] != after[i]
+        ]
+    }
+
+
+def _diff_edges(before, after):
+    """Diff two edge maps by (source, target, kind, occurrence)."""
+    return {
+        'added': [_edge_json(k, after[k]) for k in sorted(after.keys() - before.keys())],
+        'removed': [_edge_json(k, before[k]) for k in sorted(before.keys() - after.keys())],
+        'changed': [
+            {'from': k[0], 'to': k[1], 'kind': k[2], 'before': before[k], 'after': after[k]}
+            for k in sorted(before.keys() & after.keys()) if before[k] != after[k]
+        ]
+    }
+
+
+def diff_text(code_a, code_b):
+    """Line diff of two diagrams in unified format."""
+    lines_a = code_a.splitlines()
+    lines_b = code_b.splitlines()
+    diff = list(difflib.unified_diff(lines_a, lines_b, 'a', 'b', lineterm=''))
+    body = diff[2:]
+
+    return {
+        'added': sum(1 for line in body if line.startswith('+')),
+        'removed': sum(1 for line in body if line.startswith('-')),
+        'diff': diff
+    }
+
+
+def diff_diagrams(code_a, code_b):
+    """Diff two Mermaid diagrams, semantically when both are flowcharts."""
+    parsed_a = parse_cached(code_a)
+    parsed_b = parse_cached(code_b)
+
+    if parsed_a is None or parsed_b is None:
+        return {'type': 'text', 'lines': diff_text(code_a, code_b)}
+
+    return {
+        'type': 'flowchart',
+        'nodes': _diff_nodes(parsed_a['nodes'], parsed_b['nodes']),
+        'edges': _diff_edges(parsed_a['edges'], parsed_b['edges']),
+        'statements': {
+            'added': sorted((parsed_b['other'] - parsed_a['other']).elements()),
+            'removed': sorted((parsed_a['other'] - parsed_b['other']).elements())
+        }
+    }
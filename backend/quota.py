@@ -0,0 +1,249 @@
+"""Per-user storage quotas.
+
+Usage lives in ``t_user_usage`` and is kept current by a trigger on
+``t_diagrams``, so a quota check reads one row instead of summing a
+user's diagrams. Checks lock that row until the write commits, which
+serializes concurrent writes of the same user against the limit.
+
+Command line usage::
+
+    python quota.py reconcile --batch-size 500 --pause 0.1
+"""
+import argparse
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock class serializing a user's change_seq assignment (see
+# bump_diagram_change_seq). Taken before the usage row so every writer
+# acquires the two in the same order.
+CHANGE_SEQ_LOCK_CLASS = 2
+
+
+class QuotaExceeded(Exception):
+    """Raised when a write would take a user over their quota."""
+
+
+def storage_bytes(code=None, code_blob=None, thumbnail=None):
+    """Return the stored size of diagram columns, as counted by diagram_storage_bytes()."""
+    size = 0
+    if code is not None:
+        size += len(code.encode('utf-8'))
+    if code_blob is not None:
+        size += len(code_blob)
+    if thumbnail is not None:
+        size += len(thumbnail.encode('utf-8'))
+    return size
+
+
+class UsageQuota:
+    """Checks writes against ``QUOTA_MAX_DIAGRAMS`` and ``QUOTA_MAX_BYTES``.
+
+    A limit of 0 means unlimited. All checks take the caller's cursor so
+    they run in the same transaction as the write they guard.
+    """
+
+    def __init__(self):
+        self.max_diagrams = int(os.getenv('QUOTA_MAX_DIAGRAMS', 0))
+        self.max_bytes = int(os.getenv('QUOTA_MAX_BYTES', 0))
+
+    @property
+    def enabled(self):
+        return bool(self.max_diagrams or self.max_bytes)
+
+    def limits(self):
+        """Return the configured limits, None for unlimited."""
+        return {
+            'max_diagrams': self.max_diagrams or None,
+            'max_bytes': self.max_bytes or None
+        }
+
+    def get_usage(self, user_id):
+        """Return the usage counters of a user."""
+        query = """
+            SELECT diagram_count, bytes_used, trash_count, trash_bytes
+            FROM t_user_usage
+            WHERE user_id = %s
+        """
+        usage = db.execute_query(query, (user_id,), fetch_one=True)
+        return dict(usage) if usage else {
+            'diagram_count': 0, 'bytes_used': 0, 'trash_count': 0, 'trash_bytes': 0
+        }
+
+    def _lock_usage(self, cursor, user_id):
+        """Lock and return the user's usage row, creating it if missing."""
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (CHANGE_SEQ_LOCK_CLASS, user_id))
+        cursor.execute("""
+            SELECT diagram_count, bytes_used FROM t_user_usage
+            WHERE user_id = %s
+            FOR UPDATE
+        """, (user_id,))
+        usage = cursor.fetchone()
+        if usage is None:
+            cursor.execute("""
+                INSERT INTO t_user_usage (user_id) VALUES (%s)
+                ON CONFLICT (user_id) DO UPDATE SET user_id = EXCLUDED.user_id
+                RETURNING diagram_count, bytes_used
+            """, (user_id,))
+            usage = cursor.fetchone()
+        return usage
+
+    def check(self, cursor, user_id, diagrams=0, bytes_delta=0):
+        """Raise QuotaExceeded if adding diagrams and bytes would exceed a limit."""
+        if not self.enabled or (diagrams <= 0 and bytes_delta <= 0):
+            return
+
+        self._check_locked(self._lock_usage(cursor, user_id), diagrams, bytes_delta)
+
+    def _check_locked(self, usage, diagrams, bytes_delta):
+        """Check a change against usage read under ``_lock_usage``."""
+        if self.max_diagrams and diagrams > 0 and usage['diagram_count'] + diagrams > self.max_diagrams:
+            raise QuotaExceeded(f"Diagram limit of {self.max_diagrams} reached")
+
+        if self.max_bytes and bytes_delta > 0 and usage['bytes_used'] + bytes_delta > self.max_bytes:
+            raise QuotaExceeded(f"Storage limit of {self.max_bytes} bytes exceeded")
+
+    def check_update(self, cursor, user_id, diagram_id, new_sizes):
+        """Check an edit replacing the ``code`` and/or ``thumbnail`` sizes in ``new_sizes``.
+
+        The usage row is locked before the old sizes are read, so
+        concurrent edits by the same user compute their deltas one at a time.
+        """
+        if not self.enabled or not new_sizes:
+            return
+
+        usage = self._lock_usage(cursor, user_id)
+
+        cursor.execute("""
+            SELECT COALESCE(octet_length(code), 0) + COALESCE(octet_length(code_blob), 0) AS code,
+                   COALESCE(octet_length(thumbnail), 0) AS thumbnail
+            FROM t_diagrams
+            WHERE id = %s AND user_id = %s
+        """, (diagram_id, user_id))
+        current = cursor.fetchone()
+        if current is None:
+            return
+
+        delta = sum(size - current[column] for column, size in new_sizes.items())
+        self._check_locked(usage, 0, delta)
+
+    def check_restore(self, cursor, user_id, diagram_ids):
+        """Check moving trashed diagrams back into live usage."""
+        if not self.enabled:
+            return
+
+        cursor.execute("""
+            SELECT COUNT(*) AS diagrams,
+                   COALESCE(SUM(diagram_storage_bytes(code, code_blob, thumbnail)), 0) AS bytes
+            FROM t_diagrams
+            WHERE id = ANY(%s) AND user_id = %s AND is_deleted = TRUE
+        """, (list(diagram_ids), user_id))
+        restored = cursor.fetchone()
+        self.check(cursor, user_id, diagrams=restored['diagrams'], bytes_delta=restored['bytes'])
+
+
+# Global usage quota instance
+usage_quota = UsageQuota()
+
+
+def reconcile_batch(user_ids):
+    """Recompute the usage of some users from their diagrams.
+
+    Returns the number of users whose counters had drifted. The usage
+    rows are locked before the recount, so triggers of concurrent writes
+    either committed before it (and are counted) or apply their delta
+    after it.
+    """
+    with db.get_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO t_user_usage (user_id)
+            SELECT unnest(%s::int[])
+            ON CONFLICT (user_id) DO NOTHING
+        """, (user_ids,))
+
+        cursor.execute("""
+            SELECT user_id FROM t_user_usage
+            WHERE user_id = ANY(%s)
+            ORDER BY user_id
+            FOR UPDATE
+        """, (user_ids,))
+
+        cursor.execute("""
+            UPDATE t_user_usage AS u
+            SET diagram_count = a.diagram_count,
+                bytes_used = a.bytes_used,
+                trash_count = a.trash_count,
+                trash_bytes = a.trash_bytes,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT ids.user_id,
+                       COUNT(d.id) FILTER (WHERE d.is_deleted = FALSE) AS diagram_count,
+                       COALESCE(SUM(diagram_storage_bytes(d.code, d.code_blob, d.thumbnail))
+                                FILTER (WHERE d.is_deleted = FALSE), 0) AS bytes_used,
+                       COUNT(d.id) FILTER (WHERE d.is_deleted = TRUE) AS trash_count,
+                       COALESCE(SUM(diagram_storage_bytes(d.code, d.code_blob, d.thumbnail))
+                                FILTER (WHERE d.is_deleted = TRUE), 0) AS trash_bytes
+                FROM unnest(%s::int[]) AS ids(user_id)
+                LEFT JOIN t_diagrams d ON d.user_id = ids.user_id
+                GROUP BY ids.user_id
+            ) AS a
+            WHERE u.user_id = a.user_id
+            AND (u.diagram_count, u.bytes_used, u.trash_count, u.trash_bytes)
+                IS DISTINCT FROM (a.diagram_count, a.bytes_used, a.trash_count, a.trash_bytes)
+            RETURNING u.user_id
+        """, (user_ids,))
+        drifted = cursor.fetchall()
+
+    for row in drifted:
+        logger.warning("Repaired usage drift for user %s", row['user_id'])
+    return len(drifted)
+
+
+def reconcile(batch_size, pause):
+    """Recompute every user's usage in id-ordered batches."""
+    last_id = 0
+    checked = 0
+    repaired = 0
+
+    while True:
+        query = "SELECT id FROM t_users WHERE id > %s ORDER BY id LIMIT %s"
+        rows = db.execute_query(query, (last_id, batch_size), fetch_all=True)
+        if not rows:
+            break
+
+        user_ids = [row['id'] for row in rows]
+        last_id = user_ids[-1]
+        repaired += reconcile_batch(user_ids)
+        checked += len(user_ids)
+
+        logger.info("Checked %d users (last id %d), repaired %d", checked, last_id, repaired)
+        time.sleep(pause)
+
+    return checked, repaired
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storage quota tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reconcile_parser = subparsers.add_parser('reconcile', help='repair drifted usage counters')
+    reconcile_parser.add_argument('--batch-size', type=int, default=500)
+    reconcile_parser.add_argument('--pause', type=float, default=0.1)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    checked, repaired = reconcile(args.batch_size, args.pause)
+    print(f"Checked {checked} users, repaired {repaired}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Audit log query routes."""
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from psycopg2.extras import RealDictCursor
+from auth import require_auth, require_admin
+from database import db
+from datetime import datetime
+import base64
+import json
+import os
+
+audit_bp = Blueprint('audit', __name__, url_prefix='/api/audit')
+
+# Audit listing page size
+MAX_AUDIT_PER_PAGE = 200
+
+# Rows fetched per round trip by the export's server-side cursor
+EXPORT_FETCH_SIZE = int(os.getenv('AUDIT_EXPORT_FETCH_SIZE', 2000))
+
+AUDIT_COLUMNS = """
+    id, user_id, action, resource_type, resource_id,
+    ip_address, user_agent, metadata, created_at
+"""
+
+
+def _serialize_event(event):
+    """Convert an audit log row to its JSON representation."""
+    return {
+        'id': event['id'],
+        'user_id': event['user_id'],
+        'action': event['action'],
+        'resource_type': event['resource_type'],
+        'resource_id': event['resource_id'],
+        'ip_address': event['ip_address'],
+        'user_agent': event['user_agent'],
+        'metadata': event['metadata'],
+        'created_at': event['created_at'].isoformat() if event['created_at'] else None
+    }
+
+
+def _encode_cursor(event):
+    """Encode the keyset position after an event as an opaque string."""
+    raw = f"{event['created_at'].isoformat()}|{event['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    """Decode a cursor into a (created_at, id) pair. Raises ValueError."""
+    created_at, _, event_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').partition('|')
+    return datetime.fromisoformat(created_at), int(event_id)
+
+
+def _build_filters(args, user_id=None):
+    """Build the WHERE clauses for audit filters in the query string.
+
+    ``user_id`` pins the query to one user (self-service); otherwise the
+    ``user_id`` argument is honoured. Returns (clauses, params, error).
+    """
+    clauses = []
+    params = []
+
+    try:
+        if user_id is None and args.get('user_id'):
+            user_id = int(args['user_id'])
+        if user_id is not None:
+            clauses.append('user_id = %s')
+            params.append(user_id)
+
+        if args.get('resource_type'):
+            clauses.append('resource_type = %s')
+            params.append(args['resource_type'])
+
+        if args.get('resource_id'):
+            clauses.append('resource_id = %s')
+            params.append(int(args['resource_id']))
+
+        if args.get('action'):
+            clauses.append('action = %s')
+            params.append(args['action'])
+
+        if args.get('since'):
+            clauses.append('created_at >= %s')
+            params.append(datetime.fromisoformat(args['since']))
+
+        if args.get('until'):
+            clauses.append('created_at < %s')
+            params.append(datetime.fromisoformat(args['until']))
+    except ValueError:
+        return None, None, 'user_id and resource_id must be integers, since and until ISO timestamps'
+
+    return clauses, params, None
+
+
+def _query_events(user_id=None):
+    """Return one keyset page of audit events, newest first."""
+    clauses, params, error = _build_filters(request.args, user_id)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    if limit < 1:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    limit = min(limit, MAX_AUDIT_PER_PAGE)
+
+    if request.args.get('cursor'):
+        try:
+            clauses.append('(created_at, id) < (%s, %s)')
+            params.extend(_decode_cursor(request.args['cursor']))
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    query = f"""
+        SELECT {AUDIT_COLUMNS}
+        FROM t_audit_logs
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """
+    rows = db.execute_query(query, tuple(params) + (limit + 1,), fetch_all=True)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({
+        'events': [_serialize_event(row) for row in rows],
+        'cursor': _encode_cursor(rows[-1]) if has_more else None,
+        'has_more': has_more
+    }), 200
+
+
+@audit_bp.route('/me', methods=['GET'])
+@require_auth
+def get_my_audit_events():
+    """List the authenticated user's own audit events."""
+    try:
+        return _query_events(user_id=request.user_id)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@audit_bp.route('', methods=['GET'])
+@require_auth
+@require_admin
+def get_audit_events():
+    """List audit events of any user or resource (admin only)."""
+    try:
+        return _query_events()
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@audit_bp.route('/export', methods=['GET'])
+@require_auth
+@require_admin
+def export_audit_events():
+    """Stream matching audit events as NDJSON (admin only).
+
+    Rows come from a server-side cursor on a dedicated read-only
+    connection (the replica when configured), so memory stays flat and no
+    pooled connection is held for the length of the download. Rows are
+    emitted in storage order, which is close to chronological.
+    """
+    try:
+        clauses, params, error = _build_filters(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+
+        if not request.args.get('since') or not request.args.get('until'):
+            return jsonify({'error': 'since and until are required'}), 400
+
+        where = f"WHERE {' AND '.join(clauses)}"
+        query = f"SELECT {AUDIT_COLUMNS} FROM t_audit_logs {where}"
+
+        # Connect up front so connection errors still get a JSON 500
+        conn = db.connect_readonly()
+
+        def generate():
+            with conn.cursor('audit_export', cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = EXPORT_FETCH_SIZE
+                cursor.execute(query, tuple(params))
+                for row in cursor:
+                    yield json.dumps(_serialize_event(row)) + '\n'
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        # Runs even if the client disconnects before the first row
+        response.call_on_close(conn.close)
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
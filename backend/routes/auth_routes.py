@@ -1,13 +1,12 @@
 """Authentication routes."""
 from flask import Blueprint, request, jsonify, redirect
-from google_auth import GoogleAuthProvider
-from auth import AuthManager, log_audit
+from google_auth import get_google_auth
+from auth import get_auth_manager, log_audit, require_auth
+from login_service import get_login_service
 import secrets
 import os
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
-google_auth = GoogleAuthProvider()
-auth_manager = AuthManager()
 
 
 @auth_bp.route('/google/url', methods=['GET'])
@@ -16,7 +15,7 @@ def get_google_auth_url():
     try:
         state = secrets.token_urlsafe(32)
         # In production, store state in session or cache to verify later
-        url = google_auth.get_authorization_url(state)
+        url = get_google_auth().get_authorization_url(state)
         return redirect(url)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -26,18 +25,17 @@ def get_google_auth_url():
 def google_callback():
     """Handle Google OAuth callback."""
     import logging
-    import traceback
     logger = logging.getLogger(__name__)
 
     try:
-        logger.info("=== Google OAuth Callback Started ===")
+        logger.debug("Google OAuth callback started")
         code = request.args.get('code')
         error = request.args.get('error')
 
-        logger.info(f"Received code: {code[:20]}..." if code else "No code received")
+        logger.debug("Received code: %.20s...", code)
 
         if error:
-            logger.error(f"OAuth error from Google: {error}")
+            logger.error("OAuth error from Google: %s", error)
             return jsonify({'error': error}), 400
 
         if not code:
@@ -45,54 +43,39 @@ def google_callback():
             return jsonify({'error': 'No authorization code provided'}), 400
 
         # Exchange code for tokens
-        logger.info("Step 1: Exchanging code for tokens...")
-        token_data = google_auth.exchange_code_for_token(code)
-        logger.info("Token exchange successful")
+        logger.debug("Step 1: Exchanging code for tokens...")
+        token_data = get_google_auth().exchange_code_for_token(code)
+        logger.debug("Token exchange successful")
 
         id_token = token_data.get('id_token')
         access_token = token_data.get('access_token')
 
         # Verify ID token
-        logger.info("Step 2: Verifying ID token...")
-        id_info = google_auth.verify_id_token(id_token)
+        logger.debug("Step 2: Verifying ID token...")
+        id_info = get_google_auth().verify_id_token(id_token)
         if not id_info:
             logger.error("ID token verification failed")
             return jsonify({'error': 'Invalid ID token'}), 401
-        logger.info(f"ID token verified for user: {id_info.get('email')}")
+        logger.debug("ID token verified for user: %s", id_info.get('email'))
 
         # Get user info
-        logger.info("Step 3: Getting user info from Google...")
-        user_info = google_auth.get_user_info(access_token)
-        logger.info(f"User info retrieved: {user_info.get('email')}")
+        logger.debug("Step 3: Getting user info from Google...")
+        user_info = get_google_auth().get_user_info(access_token)
+        logger.debug("User info retrieved: %s", user_info.get('email'))
 
-        # Find or create user
-        logger.info("Step 4: Finding or creating user in database...")
-        user = google_auth.find_or_create_user(user_info)
-        logger.info(f"User found/created with ID: {user['id']}")
-
-        # Generate JWT tokens
-        logger.info("Step 5: Generating JWT tokens...")
-        jwt_access_token = auth_manager.generate_access_token(user['id'], user['email'])
-        jwt_refresh_token = auth_manager.generate_refresh_token(user['id'])
-        logger.info("JWT tokens generated successfully")
-
-        # Log audit event
-        logger.info("Step 6: Logging audit event...")
-        log_audit('login', metadata={'method': 'google_oauth'})
-        logger.info("Audit log created")
+        # Upsert user, issue tokens and write the audit record in one round trip
+        logger.debug("Step 4: Logging user in...")
+        user, jwt_access_token, jwt_refresh_token = get_login_service().login(user_info)
+        logger.info("Google OAuth login succeeded", extra={'user_id': user['id']})
 
         # Redirect to frontend with tokens in URL
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
         redirect_url = f"{frontend_url}/?access_token={jwt_access_token}&refresh_token={jwt_refresh_token}"
-        logger.info(f"Step 7: Redirecting to frontend: {frontend_url}")
-        logger.info("=== Google OAuth Callback Completed Successfully ===")
+        logger.debug("Step 5: Redirecting to frontend: %s", frontend_url)
         return redirect(redirect_url)
 
     except Exception as e:
-        logger.error("=== Google OAuth Callback Failed ===")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error message: {str(e)}")
-        logger.error(f"Traceback:\n{traceback.format_exc()}")
+        logger.exception("Google OAuth callback failed: %s", type(e).__name__)
         return jsonify({'error': str(e)}), 500
 
 
@@ -107,19 +90,12 @@ def verify_google_token():
             return jsonify({'error': 'No ID token provided'}), 400
 
         # Verify ID token
-        id_info = google_auth.verify_id_token(id_token)
+        id_info = get_google_auth().verify_id_token(id_token)
         if not id_info:
             return jsonify({'error': 'Invalid ID token'}), 401
 
-        # Find or create user
-        user = google_auth.find_or_create_user(id_info)
-
-        # Generate JWT tokens
-        jwt_access_token = auth_manager.generate_access_token(user['id'], user['email'])
-        jwt_refresh_token = auth_manager.generate_refresh_token(user['id'])
-
-        # Log audit event
-        log_audit('login', metadata={'method': 'google_oauth'})
+        # Upsert user, issue tokens and write the audit record in one round trip
+        user, jwt_access_token, jwt_refresh_token = get_login_service().login(id_info)
 
         return jsonify({
             'access_token': jwt_access_token,
@@ -147,7 +123,7 @@ def refresh_token():
             return jsonify({'error': 'No refresh token provided'}), 400
 
         # Verify refresh token
-        user_id = auth_manager.verify_refresh_token(refresh_token)
+        user_id = get_auth_manager().verify_refresh_token(refresh_token)
         if not user_id:
             return jsonify({'error': 'Invalid or expired refresh token'}), 401
 
@@ -160,7 +136,7 @@ def refresh_token():
             return jsonify({'error': 'User not found'}), 404
 
         # Generate new access token
-        new_access_token = auth_manager.generate_access_token(user['id'], user['email'])
+        new_access_token = get_auth_manager().generate_access_token(user['id'], user['email'])
 
         return jsonify({'access_token': new_access_token}), 200
 
@@ -179,13 +155,13 @@ def logout():
         # Revoke access token if provided
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
-            payload = auth_manager.verify_access_token(token)
+            payload = get_auth_manager().verify_access_token(token)
             if payload:
-                auth_manager.revoke_token(payload['jti'])
+                get_auth_manager().revoke_token(payload['jti'])
 
         # Revoke refresh token if provided
         if refresh_token:
-            auth_manager.revoke_refresh_token(refresh_token)
+            get_auth_manager().revoke_refresh_token(refresh_token)
 
         # Log audit event
         log_audit('logout')
@@ -206,7 +182,7 @@ def get_current_user():
             return jsonify({'error': 'Missing authorization header'}), 401
 
         token = auth_header.split(' ')[1]
-        payload = auth_manager.verify_access_token(token)
+        payload = get_auth_manager().verify_access_token(token)
 
         if not payload:
             return jsonify({'error': 'Invalid or expired token'}), 401
@@ -231,3 +207,19 @@ def get_current_user():
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/me/usage', methods=['GET'])
+@require_auth
+def get_current_user_usage():
+    """Get the current user's storage usage and quota limits."""
+    try:
+        from quota import usage_quota
+
+        return jsonify({
+            'usage': usage_quota.get_usage(request.user_id),
+            'limits': usage_quota.limits()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
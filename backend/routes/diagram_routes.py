@@ -2,9 +2,80 @@
 from flask import Blueprint, request, jsonify
 from auth import require_auth, log_audit
 from database import db
+from change_feed import change_listener
+from trash_purger import TRASH_RETENTION_DAYS
+from storage_codec import code_codec
+from cache import diagram_cache, share_cache
+import share_links
+from mermaid_diff import diff_diagrams
+from quota import usage_quota, storage_bytes, QuotaExceeded
+from idempotency import idempotent, record_response
+import os
 
 diagram_bp = Blueprint('diagrams', __name__, url_prefix='/api/diagrams')
 
+# Upper bound on the number of IDs accepted by the batch endpoints
+MAX_BATCH_IDS = int(os.getenv('DIAGRAM_BATCH_MAX_IDS', 200))
+
+# Change feed page size and long-poll limits
+MAX_CHANGES_PER_PAGE = int(os.getenv('DIAGRAM_CHANGES_MAX_LIMIT', 500))
+MAX_CHANGES_WAIT = int(os.getenv('DIAGRAM_CHANGES_MAX_WAIT', 25))
+
+# Trash listing page size
+MAX_TRASH_PER_PAGE = 100
+
+
+def _serialize_diagram(diagram):
+    """Convert a diagram row to its JSON representation."""
+    return {
+        'id': diagram['id'],
+        'title': diagram['title'],
+        'code': code_codec.decode_row(diagram),
+        'thumbnail': diagram['thumbnail'],
+        'folder_id': diagram.get('folder_id'),
+        'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
+        'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
+    }
+
+
+def _parse_batch_ids(data):
+    """Validate the ``ids`` list of a batch request.
+
+    Returns a tuple of (ids, error). Duplicate IDs are collapsed while
+    preserving the order in which they were requested.
+    """
+    ids = (data or {}).get('ids')
+
+    if not isinstance(ids, list) or not ids:
+        return None, 'ids must be a non-empty list'
+
+    if any(isinstance(i, bool) or not isinstance(i, int) for i in ids):
+        return None, 'ids must be integers'
+
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        return None, f'At most {MAX_BATCH_IDS} ids are allowed per request'
+
+    return ids, None
+
+
+def _valid_folder_id(folder_id):
+    """A folder id is an integer, or None for the root."""
+    return folder_id is None or (isinstance(folder_id, int) and not isinstance(folder_id, bool))
+
+
+def _lock_folder(cursor, user_id, folder_id):
+    """Check that a folder exists and belongs to the user.
+
+    Takes the same lock as a foreign key check, so the folder cannot be
+    deleted before the caller's transaction commits.
+    """
+    cursor.execute(
+        "SELECT 1 FROM t_folders WHERE id = %s AND user_id = %s FOR KEY SHARE",
+        (folder_id, user_id)
+    )
+    return cursor.fetchone() is not None
+
 
 @diagram_bp.route('', methods=['GET'])
 @require_auth
@@ -13,25 +84,17 @@ def get_diagrams():
     try:
         user_id = request.user_id
 
-        query = """
-            SELECT id, title, code, thumbnail, created_at, updated_at
-            FROM t_diagrams
-            WHERE user_id = %s AND is_deleted = FALSE
-            ORDER BY updated_at DESC
-        """
-        diagrams = db.execute_query(query, (user_id,), fetch_all=True)
+        def load():
+            query = """
+                SELECT id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at
+                FROM t_diagrams
+                WHERE user_id = %s AND is_deleted = FALSE
+                ORDER BY updated_at DESC
+            """
+            diagrams = db.execute_query(query, (user_id,), fetch_all=True)
+            return [_serialize_diagram(diagram) for diagram in diagrams]
 
-        # Convert timestamps to ISO format
-        result = []
-        for diagram in diagrams:
-            result.append({
-                'id': diagram['id'],
-                'title': diagram['title'],
-                'code': diagram['code'],
-                'thumbnail': diagram['thumbnail'],
-                'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
-                'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
-            })
+        result = diagram_cache.get_or_load(user_id, 'list', load)
 
         return jsonify({'diagrams': result}), 200
 
@@ -46,25 +109,22 @@ def get_diagram(diagram_id):
     try:
         user_id = request.user_id
 
-        query = """
-            SELECT id, title, code, thumbnail, created_at, updated_at
-            FROM t_diagrams
-            WHERE id = %s AND user_id = %s AND is_deleted = FALSE
-        """
-        diagram = db.execute_query(query, (diagram_id, user_id), fetch_one=True)
+        def load():
+            query = """
+                SELECT id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at
+                FROM t_diagrams
+                WHERE id = %s AND user_id = %s AND is_deleted = FALSE
+            """
+            diagram = db.execute_query(query, (diagram_id, user_id), fetch_one=True)
+            return _serialize_diagram(diagram) if diagram else None
+
+        diagram = diagram_cache.get_or_load(user_id, f'item:{diagram_id}', load)
 
         if not diagram:
             return jsonify({'error': 'Diagram not found'}), 404
 
         return jsonify({
-            'diagram': {
-                'id': diagram['id'],
-                'title': diagram['title'],
-                'code': diagram['code'],
-                'thumbnail': diagram['thumbnail'],
-                'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
-                'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
-            }
+            'diagram': diagram
         }), 200
 
     except Exception as e:
@@ -73,6 +133,7 @@ def get_diagram(diagram_id):
 
 @diagram_bp.route('', methods=['POST'])
 @require_auth
+@idempotent
 def create_diagram():
     """Create a new diagram."""
     try:
@@ -82,6 +143,7 @@ def create_diagram():
         title = data.get('title', '').strip()
         code = data.get('code', '').strip()
         thumbnail = data.get('thumbnail')
+        folder_id = data.get('folder_id')
 
         if not title:
             return jsonify({'error': 'Title is required'}), 400
@@ -89,26 +151,37 @@ def create_diagram():
         if not code:
             return jsonify({'error': 'Code is required'}), 400
 
+        if not _valid_folder_id(folder_id):
+            return jsonify({'error': 'folder_id must be an integer'}), 400
+
+        stored_code, code_blob, codec = code_codec.encode(code)
+
         query = """
-            INSERT INTO t_diagrams (user_id, title, code, thumbnail)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, title, code, thumbnail, created_at, updated_at
+            INSERT INTO t_diagrams (user_id, title, code, code_blob, code_codec, thumbnail, folder_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at
         """
-        diagram = db.execute_query(query, (user_id, title, code, thumbnail), fetch_one=True)
+        with db.get_cursor() as cursor:
+            usage_quota.check(
+                cursor, user_id,
+                diagrams=1, bytes_delta=storage_bytes(stored_code, code_blob, thumbnail)
+            )
+            if folder_id is not None and not _lock_folder(cursor, user_id, folder_id):
+                return jsonify({'error': 'Folder not found'}), 404
+            cursor.execute(query, (user_id, title, stored_code, code_blob, codec, thumbnail, folder_id))
+            diagram = cursor.fetchone()
+            body = {'diagram': _serialize_diagram(diagram)}
+            record_response(cursor, body, 201)
+
+        diagram_cache.invalidate_user(user_id)
 
         # Log audit event
         log_audit('create_diagram', 'diagram', diagram['id'])
 
-        return jsonify({
-            'diagram': {
-                'id': diagram['id'],
-                'title': diagram['title'],
-                'code': diagram['code'],
-                'thumbnail': diagram['thumbnail'],
-                'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
-                'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
-            }
-        }), 201
+        return jsonify(body), 201
+
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 403
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -116,6 +189,7 @@ def create_diagram():
 
 @diagram_bp.route('/<int:diagram_id>', methods=['PUT'])
 @require_auth
+@idempotent
 def update_diagram(diagram_id):
     """Update an existing diagram."""
     try:
@@ -135,6 +209,8 @@ def update_diagram(diagram_id):
         # Build update query dynamically based on provided fields
         update_fields = []
         params = []
+        # New stored sizes of the columns counted against the storage quota
+        new_sizes = {}
 
         if 'title' in data:
             update_fields.append('title = %s')
@@ -142,11 +218,23 @@ def update_diagram(diagram_id):
 
         if 'code' in data:
             update_fields.append('code = %s')
-            params.append(data['code'].strip())
+            update_fields.append('code_blob = %s')
+            update_fields.append('code_codec = %s')
+            stored_code, code_blob, codec = code_codec.encode(data['code'].strip())
+            params.extend((stored_code, code_blob, codec))
+            new_sizes['code'] = storage_bytes(stored_code, code_blob)
 
         if 'thumbnail' in data:
             update_fields.append('thumbnail = %s')
             params.append(data['thumbnail'])
+            new_sizes['thumbnail'] = storage_bytes(thumbnail=data['thumbnail'])
+
+        if 'folder_id' in data:
+            # null moves the diagram back to the root
+            if not _valid_folder_id(data['folder_id']):
+                return jsonify({'error': 'folder_id must be an integer'}), 400
+            update_fields.append('folder_id = %s')
+            params.append(data['folder_id'])
 
         if not update_fields:
             return jsonify({'error': 'No fields to update'}), 400
@@ -160,23 +248,28 @@ def update_diagram(diagram_id):
             UPDATE t_diagrams
             SET {', '.join(update_fields)}
             WHERE id = %s AND user_id = %s
-            RETURNING id, title, code, thumbnail, created_at, updated_at
+            RETURNING id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at
         """
-        diagram = db.execute_query(query, tuple(params), fetch_one=True)
+        with db.get_cursor() as cursor:
+            usage_quota.check_update(cursor, user_id, diagram_id, new_sizes)
+            if data.get('folder_id') is not None and not _lock_folder(cursor, user_id, data['folder_id']):
+                return jsonify({'error': 'Folder not found'}), 404
+            cursor.execute(query, tuple(params))
+            diagram = cursor.fetchone()
+            share_tokens = share_links.refresh_links(cursor, diagram)
+            body = {'diagram': _serialize_diagram(diagram)}
+            record_response(cursor, body, 200)
+
+        diagram_cache.invalidate_user(user_id)
+        share_links.invalidate_tokens(share_tokens)
 
         # Log audit event
         log_audit('update_diagram', 'diagram', diagram_id)
 
-        return jsonify({
-            'diagram': {
-                'id': diagram['id'],
-                'title': diagram['title'],
-                'code': diagram['code'],
-                'thumbnail': diagram['thumbnail'],
-                'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
-                'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
-            }
-        }), 200
+        return jsonify(body), 200
+
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 403
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -184,6 +277,7 @@ def update_diagram(diagram_id):
 
 @diagram_bp.route('/<int:diagram_id>', methods=['DELETE'])
 @require_auth
+@idempotent
 def delete_diagram(diagram_id):
     """Soft delete a diagram."""
     try:
@@ -203,15 +297,22 @@ def delete_diagram(diagram_id):
         query = """
             UPDATE t_diagrams
             SET is_deleted = TRUE
+               ,deleted_at = CURRENT_TIMESTAMP
                ,updated_at = CURRENT_TIMESTAMP
             WHERE id = %s AND user_id = %s
         """
-        db.execute_query(query, (diagram_id, user_id))
+        body = {'message': 'Diagram deleted successfully'}
+        with db.get_cursor() as cursor:
+            cursor.execute(query, (diagram_id, user_id))
+            record_response(cursor, body, 200)
+
+        diagram_cache.invalidate_user(user_id)
+        share_links.invalidate_links([diagram_id])
 
         # Log audit event
         log_audit('delete_diagram', 'diagram', diagram_id)
 
-        return jsonify({'message': 'Diagram deleted successfully'}), 200
+        return jsonify(body), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -238,15 +339,406 @@ def restore_diagram(diagram_id):
         query = """
             UPDATE t_diagrams
             SET is_deleted = FALSE
+               ,deleted_at = NULL
                ,updated_at = CURRENT_TIMESTAMP
             WHERE id = %s AND user_id = %s
         """
-        db.execute_query(query, (diagram_id, user_id))
+        with db.get_cursor() as cursor:
+            usage_quota.check_restore(cursor, user_id, [diagram_id])
+            cursor.execute(query, (diagram_id, user_id))
+        diagram_cache.invalidate_user(user_id)
 
         # Log audit event
         log_audit('restore_diagram', 'diagram', diagram_id)
 
         return jsonify({'message': 'Diagram restored successfully'}), 200
 
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 403
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _serialize_share_link(link):
+    """Convert a share link row to its JSON representation."""
+    return {
+        'token': link['token'],
+        'url': f"/api/public/{link['token']}",
+        'created_at': link['created_at'].isoformat() if link['created_at'] else None
+    }
+
+
+@diagram_bp.route('/<int:diagram_id>/share', methods=['GET'])
+@require_auth
+def get_share_link(diagram_id):
+    """Get the active public share link of a diagram."""
+    try:
+        query = """
+            SELECT token, created_at FROM t_share_links
+            WHERE diagram_id = %s AND user_id = %s AND revoked_at IS NULL
+        """
+        link = db.execute_query(query, (diagram_id, request.user_id), fetch_one=True)
+
+        if not link:
+            return jsonify({'error': 'Diagram is not shared'}), 404
+
+        return jsonify({'share': _serialize_share_link(link)}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/<int:diagram_id>/share', methods=['POST'])
+@require_auth
+def create_share_link(diagram_id):
+    """Share a diagram publicly, returning its existing link if already shared."""
+    try:
+        user_id = request.user_id
+
+        query = """
+            SELECT id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at
+            FROM t_diagrams
+            WHERE id = %s AND user_id = %s AND is_deleted = FALSE
+        """
+        diagram = db.execute_query(query, (diagram_id, user_id), fetch_one=True)
+
+        if not diagram:
+            return jsonify({'error': 'Diagram not found'}), 404
+
+        payload, etag = share_links.build_payload(diagram)
+
+        # Concurrent shares of the same diagram converge on one active link
+        query = """
+            INSERT INTO t_share_links (diagram_id, user_id, token, payload, etag)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (diagram_id) WHERE revoked_at IS NULL
+            DO UPDATE SET payload = EXCLUDED.payload, etag = EXCLUDED.etag,
+                          updated_at = CURRENT_TIMESTAMP
+            RETURNING token, created_at, (xmax = 0) AS created
+        """
+        link = db.execute_query(
+            query,
+            (diagram_id, user_id, share_links.new_token(), payload, etag),
+            fetch_one=True
+        )
+
+        share_cache.invalidate(link['token'])
+
+        if link['created']:
+            log_audit('share_diagram', 'diagram', diagram_id)
+
+        return jsonify({
+            'share': _serialize_share_link(link)
+        }), 201 if link['created'] else 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/<int:diagram_id>/share', methods=['DELETE'])
+@require_auth
+def revoke_share_link(diagram_id):
+    """Revoke the public share link of a diagram."""
+    try:
+        query = """
+            UPDATE t_share_links
+            SET revoked_at = CURRENT_TIMESTAMP
+            WHERE diagram_id = %s AND user_id = %s AND revoked_at IS NULL
+            RETURNING token
+        """
+        link = db.execute_query(query, (diagram_id, request.user_id), fetch_one=True)
+
+        if not link:
+            return jsonify({'error': 'Diagram is not shared'}), 404
+
+        share_cache.invalidate(link['token'])
+
+        # Log audit event
+        log_audit('revoke_share_diagram', 'diagram', diagram_id)
+
+        return jsonify({'message': 'Share link revoked successfully'}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/batch-get', methods=['POST'])
+@require_auth
+def batch_get_diagrams():
+    """Get several diagrams in a single request."""
+    try:
+        user_id = request.user_id
+        ids, error = _parse_batch_ids(request.get_json(silent=True))
+
+        if error:
+            return jsonify({'error': error}), 400
+
+        query = """
+            SELECT id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at
+            FROM t_diagrams
+            WHERE id = ANY(%s) AND user_id = %s AND is_deleted = FALSE
+        """
+        rows = db.execute_query(query, (ids, user_id), fetch_all=True)
+        found = {row['id']: row for row in rows}
+
+        diagrams = [_serialize_diagram(found[i]) for i in ids if i in found]
+        errors = [{'id': i, 'error': 'Diagram not found'} for i in ids if i not in found]
+
+        return jsonify({'diagrams': diagrams, 'errors': errors}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/batch-delete', methods=['POST'])
+@require_auth
+def batch_delete_diagrams():
+    """Soft delete several diagrams in a single request."""
+    try:
+        user_id = request.user_id
+        ids, error = _parse_batch_ids(request.get_json(silent=True))
+
+        if error:
+            return jsonify({'error': error}), 400
+
+        query = """
+            UPDATE t_diagrams
+            SET is_deleted = TRUE
+               ,deleted_at = CURRENT_TIMESTAMP
+               ,updated_at = CURRENT_TIMESTAMP
+            WHERE id = ANY(%s) AND user_id = %s AND is_deleted = FALSE
+            RETURNING id
+        """
+        rows = db.execute_query(query, (ids, user_id), fetch_all=True)
+        deleted = {row['id'] for row in rows}
+
+        if deleted:
+            diagram_cache.invalidate_user(user_id)
+            share_links.invalidate_links(deleted)
+            log_audit('batch_delete_diagram', 'diagram', metadata={'ids': sorted(deleted)})
+
+        return jsonify({
+            'deleted': [i for i in ids if i in deleted],
+            'errors': [{'id': i, 'error': 'Diagram not found'} for i in ids if i not in deleted]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/batch-restore', methods=['POST'])
+@require_auth
+def batch_restore_diagrams():
+    """Restore several soft-deleted diagrams in a single request."""
+    try:
+        user_id = request.user_id
+        ids, error = _parse_batch_ids(request.get_json(silent=True))
+
+        if error:
+            return jsonify({'error': error}), 400
+
+        query = """
+            UPDATE t_diagrams
+            SET is_deleted = FALSE
+               ,deleted_at = NULL
+               ,updated_at = CURRENT_TIMESTAMP
+            WHERE id = ANY(%s) AND user_id = %s AND is_deleted = TRUE
+            RETURNING id
+        """
+        with db.get_cursor() as cursor:
+            # All or nothing: the whole batch must fit in the quota
+            usage_quota.check_restore(cursor, user_id, ids)
+            cursor.execute(query, (ids, user_id))
+            restored = {row['id'] for row in cursor.fetchall()}
+
+        if restored:
+            diagram_cache.invalidate_user(user_id)
+            log_audit('batch_restore_diagram', 'diagram', metadata={'ids': sorted(restored)})
+
+        return jsonify({
+            'restored': [i for i in ids if i in restored],
+            'errors': [{'id': i, 'error': 'Deleted diagram not found'} for i in ids if i not in restored]
+        }), 200
+
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 403
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/diff', methods=['GET'])
+@require_auth
+def diff_diagram_pair():
+    """Compare two diagrams node by node and edge by edge."""
+    try:
+        user_id = request.user_id
+
+        try:
+            id_a = int(request.args['a'])
+            id_b = int(request.args['b'])
+        except (KeyError, ValueError):
+            return jsonify({'error': 'a and b must be diagram ids'}), 400
+
+        query = """
+            SELECT id, code, code_blob, code_codec
+            FROM t_diagrams
+            WHERE id = ANY(%s) AND user_id = %s AND is_deleted = FALSE
+        """
+        rows = db.execute_query(query, ([id_a, id_b], user_id), fetch_all=True)
+        codes = {row['id']: code_codec.decode_row(row) for row in rows}
+
+        missing = [i for i in dict.fromkeys((id_a, id_b)) if i not in codes]
+        if missing:
+            return jsonify({'error': 'Diagram not found', 'ids': missing}), 404
+
+        result = diff_diagrams(codes[id_a], codes[id_b])
+
+        return jsonify({'a': id_a, 'b': id_b, **result}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _fetch_changes(user_id, since, limit):
+    """Fetch up to ``limit`` diagram changes after the ``since`` cursor."""
+    query = """
+        SELECT id, title, code, code_blob, code_codec, thumbnail, folder_id, created_at, updated_at, is_deleted, change_seq
+        FROM t_diagrams
+        WHERE user_id = %s AND change_seq > %s
+        ORDER BY change_seq
+        LIMIT %s
+    """
+    return db.execute_query(query, (user_id, since, limit + 1), fetch_all=True)
+
+
+def _purged_change_seq(user_id):
+    """Return the highest change_seq of the user's purged diagrams (0 if none)."""
+    query = "SELECT purged_seq FROM t_change_watermarks WHERE user_id = %s"
+    row = db.execute_query(query, (user_id,), fetch_one=True)
+    return row['purged_seq'] if row else 0
+
+
+@diagram_bp.route('/changes', methods=['GET'])
+@require_auth
+def get_diagram_changes():
+    """Get diagrams created, updated, deleted or restored after a cursor.
+
+    Pass ``wait=<seconds>`` to long-poll: if nothing changed yet, the
+    request blocks until a change is notified or the timeout expires.
+
+    A user's ``change_seq`` values are assigned under a per-user lock held
+    until commit, so they become visible in increasing order: once a
+    change is returned, no change with a lower cursor can appear later.
+    Advancing the cursor to the last returned change never skips one.
+
+    Returns 410 with ``resync: true`` when ``since`` is older than a purged
+    tombstone: the deletion can no longer be reported, so the client must
+    refetch from ``since=0`` and replace its local state.
+    """
+    try:
+        user_id = request.user_id
+
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', MAX_CHANGES_PER_PAGE))
+            wait = float(request.args.get('wait', 0))
+        except ValueError:
+            return jsonify({'error': 'since, limit and wait must be numbers'}), 400
+
+        if since < 0 or limit < 1:
+            return jsonify({'error': 'Invalid since or limit'}), 400
+
+        limit = min(limit, MAX_CHANGES_PER_PAGE)
+        wait = max(0, min(wait, MAX_CHANGES_WAIT))
+
+        snapshot = change_listener.snapshot(user_id) if wait else None
+        rows = _fetch_changes(user_id, since, limit)
+
+        if not rows and wait and change_listener.wait(user_id, snapshot, wait):
+            rows = _fetch_changes(user_id, since, limit)
+
+        # Checked after the fetch so a purge committed before it is seen
+        if since and since < _purged_change_seq(user_id):
+            return jsonify({
+                'error': 'Cursor is older than purged deletions; resync from since=0',
+                'resync': True
+            }), 410
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        changes = []
+        for row in rows:
+            if row['is_deleted']:
+                changes.append({
+                    'id': row['id'],
+                    'is_deleted': True,
+                    'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
+                })
+            else:
+                changes.append({**_serialize_diagram(row), 'is_deleted': False})
+
+        return jsonify({
+            'changes': changes,
+            'cursor': rows[-1]['change_seq'] if rows else since,
+            'has_more': has_more
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@diagram_bp.route('/trash', methods=['GET'])
+@require_auth
+def get_trash():
+    """List soft-deleted diagrams, most recently deleted first."""
+    try:
+        user_id = request.user_id
+
+        try:
+            limit = int(request.args.get('limit', 50))
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+
+        if limit < 1 or offset < 0:
+            return jsonify({'error': 'Invalid limit or offset'}), 400
+
+        limit = min(limit, MAX_TRASH_PER_PAGE)
+
+        query = """
+            SELECT id, title, thumbnail, created_at, deleted_at,
+                   deleted_at + make_interval(days => %s) AS purge_at
+            FROM t_diagrams
+            WHERE user_id = %s AND is_deleted = TRUE
+            ORDER BY deleted_at DESC NULLS LAST, id DESC
+            LIMIT %s OFFSET %s
+        """
+        rows = db.execute_query(
+            query,
+            (TRASH_RETENTION_DAYS, user_id, limit + 1, offset),
+            fetch_all=True
+        )
+
+        result = []
+        for diagram in rows[:limit]:
+            result.append({
+                'id': diagram['id'],
+                'title': diagram['title'],
+                'thumbnail': diagram['thumbnail'],
+                'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
+                'deleted_at': diagram['deleted_at'].isoformat() if diagram['deleted_at'] else None,
+                'purge_at': diagram['purge_at'].isoformat() if diagram['purge_at'] else None
+            })
+
+        return jsonify({
+            'diagrams': result,
+            'limit': limit,
+            'offset': offset,
+            'has_more': len(rows) > limit
+        }), 200
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,419 @@
+"""Folder management routes."""
+from flask import Blueprint, request, jsonify
+from auth import require_auth, log_audit
+from database import db
+from cache import diagram_cache
+
+folder_bp = Blueprint('folders', __name__, url_prefix='/api/folders')
+
+# Advisory lock class guarding a user's folder tree (see maintain_folder_diagram_counts)
+FOLDER_LOCK_CLASS = 1
+
+# Children listing page size
+MAX_CHILDREN_PER_PAGE = 200
+
+
+def _serialize_folder(folder):
+    """Convert a folder row to its JSON representation."""
+    return {
+        'id': folder['id'],
+        'parent_id': folder['parent_id'],
+        'name': folder['name'],
+        'depth': folder['depth'],
+        'diagram_count': folder['diagram_count'],
+        'subtree_diagram_count': folder['subtree_diagram_count'],
+        'subtree_folder_count': folder['subtree_folder_count'],
+        'created_at': folder['created_at'].isoformat() if folder['created_at'] else None,
+        'updated_at': folder['updated_at'].isoformat() if folder['updated_at'] else None
+    }
+
+
+def _serialize_diagram_summary(diagram):
+    """Convert a diagram row to its listing representation (without code)."""
+    return {
+        'id': diagram['id'],
+        'folder_id': diagram['folder_id'],
+        'title': diagram['title'],
+        'thumbnail': diagram['thumbnail'],
+        'created_at': diagram['created_at'].isoformat() if diagram['created_at'] else None,
+        'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
+    }
+
+
+def _path_ids(path):
+    """Return the folder ids in a materialized path, root first."""
+    return [int(part) for part in path.strip('/').split('/') if part]
+
+
+def _lock_folder_tree(cursor, user_id):
+    """Serialize structural changes to a user's folder tree."""
+    cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (FOLDER_LOCK_CLASS, user_id))
+
+
+def _valid_parent_id(parent_id):
+    """A parent id is an integer, or None for the root."""
+    return parent_id is None or (isinstance(parent_id, int) and not isinstance(parent_id, bool))
+
+
+def _get_folder(cursor, folder_id, user_id, for_update=False):
+    """Fetch a folder owned by the user, or None."""
+    cursor.execute(f"""
+        SELECT id, parent_id, name, path, depth, diagram_count,
+               subtree_diagram_count, subtree_folder_count, created_at, updated_at
+        FROM t_folders
+        WHERE id = %s AND user_id = %s
+        {'FOR UPDATE' if for_update else ''}
+    """, (folder_id, user_id))
+    return cursor.fetchone()
+
+
+def _list_children(user_id, folder_id, limit, offset):
+    """List the subfolders and a page of live diagrams directly inside a folder.
+
+    ``folder_id`` None lists the root.
+    """
+    # Plain equality / IS NULL (not IS NOT DISTINCT FROM) so both queries
+    # are range scans on the (user_id, parent/folder, ...) indexes
+    if folder_id is None:
+        parent_clause, folder_clause, params = 'parent_id IS NULL', 'folder_id IS NULL', (user_id,)
+    else:
+        parent_clause, folder_clause, params = 'parent_id = %s', 'folder_id = %s', (user_id, folder_id)
+
+    with db.get_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id, parent_id, name, path, depth, diagram_count,
+                   subtree_diagram_count, subtree_folder_count, created_at, updated_at
+            FROM t_folders
+            WHERE user_id = %s AND {parent_clause}
+            ORDER BY name
+        """, params)
+        folders = cursor.fetchall()
+
+        cursor.execute(f"""
+            SELECT id, folder_id, title, thumbnail, created_at, updated_at
+            FROM t_diagrams
+            WHERE user_id = %s AND {folder_clause} AND is_deleted = FALSE
+            ORDER BY updated_at DESC
+            LIMIT %s OFFSET %s
+        """, params + (limit + 1, offset))
+        diagrams = cursor.fetchall()
+
+    return {
+        'folders': [_serialize_folder(folder) for folder in folders],
+        'diagrams': [_serialize_diagram_summary(diagram) for diagram in diagrams[:limit]],
+        'limit': limit,
+        'offset': offset,
+        'has_more': len(diagrams) > limit
+    }
+
+
+def _children_response(user_id, folder_id):
+    """Build the children listing response for ``folder_id`` (None for root)."""
+    try:
+        limit = int(request.args.get('limit', MAX_CHILDREN_PER_PAGE))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+
+    if limit < 1 or offset < 0:
+        return jsonify({'error': 'Invalid limit or offset'}), 400
+
+    limit = min(limit, MAX_CHILDREN_PER_PAGE)
+
+    result = diagram_cache.get_or_load(
+        user_id,
+        f'folder:{folder_id or "root"}:{limit}:{offset}',
+        lambda: _list_children(user_id, folder_id, limit, offset)
+    )
+    return jsonify(result), 200
+
+
+@folder_bp.route('', methods=['GET'])
+@require_auth
+def get_root_children():
+    """List top-level folders and diagrams that are not in any folder."""
+    try:
+        return _children_response(request.user_id, None)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('', methods=['POST'])
+@require_auth
+def create_folder():
+    """Create a folder, optionally inside a parent folder."""
+    try:
+        user_id = request.user_id
+        data = request.get_json() or {}
+
+        name = (data.get('name') or '').strip()
+        parent_id = data.get('parent_id')
+
+        if not name:
+            return jsonify({'error': 'Name is required'}), 400
+
+        if not _valid_parent_id(parent_id):
+            return jsonify({'error': 'parent_id must be an integer'}), 400
+
+        with db.get_cursor() as cursor:
+            _lock_folder_tree(cursor, user_id)
+
+            parent_path, parent_depth = '/', -1
+            if parent_id is not None:
+                parent = _get_folder(cursor, parent_id, user_id)
+                if not parent:
+                    return jsonify({'error': 'Parent folder not found'}), 404
+                parent_path, parent_depth = parent['path'], parent['depth']
+
+            cursor.execute("""
+                WITH new_folder AS (
+                    SELECT nextval(pg_get_serial_sequence('t_folders', 'id')) AS id
+                )
+                INSERT INTO t_folders (id, user_id, parent_id, name, path, depth, updated_at)
+                SELECT id, %s, %s, %s, %s || id || '/', %s, CURRENT_TIMESTAMP
+                FROM new_folder
+                RETURNING id, parent_id, name, path, depth, diagram_count,
+                          subtree_diagram_count, subtree_folder_count, created_at, updated_at
+            """, (user_id, parent_id, name, parent_path, parent_depth + 1))
+            folder = cursor.fetchone()
+
+            if parent_id is not None:
+                cursor.execute("""
+                    UPDATE t_folders
+                    SET subtree_folder_count = subtree_folder_count + 1
+                    WHERE id = ANY(%s::int[])
+                """, (_path_ids(parent_path),))
+
+        diagram_cache.invalidate_user(user_id)
+
+        # Log audit event
+        log_audit('create_folder', 'folder', folder['id'])
+
+        return jsonify({'folder': _serialize_folder(folder)}), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('/<int:folder_id>', methods=['GET'])
+@require_auth
+def get_folder(folder_id):
+    """Get a folder with its descendant counts."""
+    try:
+        with db.get_cursor() as cursor:
+            folder = _get_folder(cursor, folder_id, request.user_id)
+
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+
+        return jsonify({'folder': _serialize_folder(folder)}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('/<int:folder_id>/children', methods=['GET'])
+@require_auth
+def get_folder_children(folder_id):
+    """List a folder's subfolders and a page of its diagrams."""
+    try:
+        user_id = request.user_id
+
+        with db.get_cursor() as cursor:
+            if not _get_folder(cursor, folder_id, user_id):
+                return jsonify({'error': 'Folder not found'}), 404
+
+        return _children_response(user_id, folder_id)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('/<int:folder_id>/tree', methods=['GET'])
+@require_auth
+def get_folder_tree(folder_id):
+    """List every folder in a subtree, in depth-first path order."""
+    try:
+        user_id = request.user_id
+
+        with db.get_cursor() as cursor:
+            folder = _get_folder(cursor, folder_id, user_id)
+            if not folder:
+                return jsonify({'error': 'Folder not found'}), 404
+
+            cursor.execute("""
+                SELECT id, parent_id, name, path, depth, diagram_count,
+                       subtree_diagram_count, subtree_folder_count, created_at, updated_at
+                FROM t_folders
+                WHERE user_id = %s AND path LIKE %s
+                ORDER BY path
+            """, (user_id, folder['path'] + '%'))
+            folders = cursor.fetchall()
+
+        return jsonify({'folders': [_serialize_folder(f) for f in folders]}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('/<int:folder_id>', methods=['PUT'])
+@require_auth
+def rename_folder(folder_id):
+    """Rename a folder."""
+    try:
+        user_id = request.user_id
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+
+        if not name:
+            return jsonify({'error': 'Name is required'}), 400
+
+        query = """
+            UPDATE t_folders
+            SET name = %s
+               ,updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND user_id = %s
+            RETURNING id, parent_id, name, path, depth, diagram_count,
+                      subtree_diagram_count, subtree_folder_count, created_at, updated_at
+        """
+        folder = db.execute_query(query, (name, folder_id, user_id), fetch_one=True)
+
+        if not folder:
+            return jsonify({'error': 'Folder not found'}), 404
+
+        diagram_cache.invalidate_user(user_id)
+
+        # Log audit event
+        log_audit('rename_folder', 'folder', folder_id)
+
+        return jsonify({'folder': _serialize_folder(folder)}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('/<int:folder_id>/move', methods=['POST'])
+@require_auth
+def move_folder(folder_id):
+    """Move a folder and its whole subtree under another parent (or the root)."""
+    try:
+        user_id = request.user_id
+        data = request.get_json() or {}
+        parent_id = data.get('parent_id')
+
+        if not _valid_parent_id(parent_id):
+            return jsonify({'error': 'parent_id must be an integer'}), 400
+
+        with db.get_cursor() as cursor:
+            _lock_folder_tree(cursor, user_id)
+
+            folder = _get_folder(cursor, folder_id, user_id)
+            if not folder:
+                return jsonify({'error': 'Folder not found'}), 404
+
+            parent_path, parent_depth = '/', -1
+            if parent_id is not None:
+                parent = _get_folder(cursor, parent_id, user_id)
+                if not parent:
+                    return jsonify({'error': 'Parent folder not found'}), 404
+                if parent['path'].startswith(folder['path']):
+                    return jsonify({'error': 'Cannot move a folder into itself'}), 400
+                parent_path, parent_depth = parent['path'], parent['depth']
+
+            old_path = folder['path']
+            new_path = f"{parent_path}{folder_id}/"
+
+            if new_path != old_path:
+                old_ancestors = _path_ids(old_path)[:-1]
+                new_ancestors = _path_ids(parent_path)
+                moved_diagrams = folder['subtree_diagram_count']
+                moved_folders = folder['subtree_folder_count'] + 1
+
+                # Move the subtree's aggregates from the old ancestors to the new ones
+                cursor.execute("""
+                    UPDATE t_folders
+                    SET subtree_diagram_count = subtree_diagram_count
+                            + CASE WHEN id = ANY(%(new)s::int[]) THEN %(diagrams)s ELSE 0 END
+                            - CASE WHEN id = ANY(%(old)s::int[]) THEN %(diagrams)s ELSE 0 END,
+                        subtree_folder_count = subtree_folder_count
+                            + CASE WHEN id = ANY(%(new)s::int[]) THEN %(folders)s ELSE 0 END
+                            - CASE WHEN id = ANY(%(old)s::int[]) THEN %(folders)s ELSE 0 END
+                    WHERE id = ANY(%(new)s::int[] || %(old)s::int[])
+                """, {
+                    'new': new_ancestors,
+                    'old': old_ancestors,
+                    'diagrams': moved_diagrams,
+                    'folders': moved_folders
+                })
+
+                # Rewrite the paths of the whole subtree in one statement
+                cursor.execute("""
+                    UPDATE t_folders
+                    SET path = %(new_path)s || substr(path, %(old_len)s + 1),
+                        depth = depth + %(depth_delta)s,
+                        parent_id = CASE WHEN id = %(id)s THEN %(parent_id)s ELSE parent_id END,
+                        updated_at = CASE WHEN id = %(id)s THEN CURRENT_TIMESTAMP ELSE updated_at END
+                    WHERE user_id = %(user_id)s AND path LIKE %(old_path)s || '%%'
+                """, {
+                    'new_path': new_path,
+                    'old_len': len(old_path),
+                    'old_path': old_path,
+                    'depth_delta': parent_depth + 1 - folder['depth'],
+                    'id': folder_id,
+                    'parent_id': parent_id,
+                    'user_id': user_id
+                })
+
+            folder = _get_folder(cursor, folder_id, user_id)
+
+        diagram_cache.invalidate_user(user_id)
+
+        # Log audit event
+        log_audit('move_folder', 'folder', folder_id, metadata={'parent_id': parent_id})
+
+        return jsonify({'folder': _serialize_folder(folder)}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@folder_bp.route('/<int:folder_id>', methods=['DELETE'])
+@require_auth
+def delete_folder(folder_id):
+    """Delete an empty folder.
+
+    Trashed diagrams that were in it stay in the trash and are restored to
+    the root.
+    """
+    try:
+        user_id = request.user_id
+
+        with db.get_cursor() as cursor:
+            _lock_folder_tree(cursor, user_id)
+
+            # Waits for diagram writes that just checked this folder, so
+            # the counts below include them
+            folder = _get_folder(cursor, folder_id, user_id, for_update=True)
+            if not folder:
+                return jsonify({'error': 'Folder not found'}), 404
+
+            if folder['subtree_diagram_count'] or folder['subtree_folder_count']:
+                return jsonify({'error': 'Folder is not empty'}), 409
+
+            cursor.execute("DELETE FROM t_folders WHERE id = %s", (folder_id,))
+            cursor.execute("""
+                UPDATE t_folders
+                SET subtree_folder_count = subtree_folder_count - 1
+                WHERE id = ANY(%s::int[])
+            """, (_path_ids(folder['path'])[:-1],))
+
+        diagram_cache.invalidate_user(user_id)
+
+        # Log audit event
+        log_audit('delete_folder', 'folder', folder_id)
+
+        return jsonify({'message': 'Folder deleted successfully'}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,29 @@
+"""Unauthenticated routes for public share links."""
+from flask import Blueprint, request, jsonify, current_app
+from share_links import get_public_payload
+import os
+
+public_bp = Blueprint('public', __name__, url_prefix='/api/public')
+
+# How long browsers and proxies may reuse a shared diagram without revalidating
+PUBLIC_SHARE_MAX_AGE = int(os.getenv('PUBLIC_SHARE_MAX_AGE', 300))
+
+
+@public_bp.route('/<token>', methods=['GET'])
+def get_shared_diagram(token):
+    """Serve the precomputed payload of a shared diagram."""
+    try:
+        shared = get_public_payload(token)
+
+        if not shared:
+            return jsonify({'error': 'Shared diagram not found'}), 404
+
+        response = current_app.response_class(shared['payload'], mimetype='application/json')
+        response.set_etag(shared['etag'])
+        response.headers['Cache-Control'] = f'public, max-age={PUBLIC_SHARE_MAX_AGE}'
+
+        # Answers If-None-Match with an empty 304
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
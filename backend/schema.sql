@@ -5,8 +5,20 @@
 DROP TABLE IF EXISTS t_audit_logs CASCADE;
 DROP TABLE IF EXISTS t_refresh_tokens CASCADE;
 DROP TABLE IF EXISTS t_sessions CASCADE;
+DROP TABLE IF EXISTS t_share_links CASCADE;
+DROP TABLE IF EXISTS t_user_usage CASCADE;
+DROP TABLE IF EXISTS t_change_watermarks CASCADE;
+DROP TABLE IF EXISTS t_idempotency_keys CASCADE;
 DROP TABLE IF EXISTS t_diagrams CASCADE;
+DROP TABLE IF EXISTS t_folders CASCADE;
+DROP TABLE IF EXISTS t_backfill_checkpoints CASCADE;
+DROP TABLE IF EXISTS t_codec_dictionaries CASCADE;
 DROP TABLE IF EXISTS t_users CASCADE;
+DROP SEQUENCE IF EXISTS t_diagrams_change_seq;
+
+-- Monotonic change cursor shared by all diagrams (see /api/diagrams/changes)
+CREATE SEQUENCE t_diagrams_change_seq;
+
 -- Users table
 CREATE TABLE t_users (
     id SERIAL PRIMARY KEY,
@@ -23,19 +35,128 @@ CREATE TABLE t_users (
 CREATE INDEX idx_t_users_google_id ON t_users(google_id);
 CREATE INDEX idx_t_users_email ON t_users(email);
 
+-- Folders table. Folders nest arbitrarily; ``path`` is the materialized
+-- path of ids from the root down to the folder itself (e.g. '/3/8/21/'),
+-- so a subtree is a single index range scan on ``path LIKE '/3/8/%'``.
+-- Diagram counts are maintained incrementally by triggers.
+CREATE TABLE t_folders (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES t_users(id) ON DELETE CASCADE,
+    parent_id INTEGER REFERENCES t_folders(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    path TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    diagram_count INTEGER NOT NULL DEFAULT 0,
+    subtree_diagram_count INTEGER NOT NULL DEFAULT 0,
+    subtree_folder_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP
+);
+
+CREATE INDEX idx_t_folders_user_path ON t_folders(user_id, path text_pattern_ops);
+CREATE INDEX idx_t_folders_user_parent ON t_folders(user_id, parent_id, name);
+
 -- Diagrams table
 CREATE TABLE t_diagrams (
     id SERIAL PRIMARY KEY,
     user_id INTEGER NOT NULL REFERENCES t_users(id) ON DELETE CASCADE,
+    folder_id INTEGER REFERENCES t_folders(id) ON DELETE SET NULL,
     title VARCHAR(500) NOT NULL,
-    code TEXT NOT NULL,
+    code TEXT,
+    code_blob BYTEA,
+    code_codec VARCHAR(32) NOT NULL DEFAULT 'plain',
     thumbnail TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP,
-    is_deleted BOOLEAN DEFAULT FALSE
+    is_deleted BOOLEAN DEFAULT FALSE,
+    deleted_at TIMESTAMP,
+    change_seq BIGINT NOT NULL DEFAULT nextval('t_diagrams_change_seq'),
+    -- Code is stored as text (plain) or compressed (see storage_codec.py)
+    CONSTRAINT chk_t_diagrams_code CHECK (
+        (code_codec = 'plain' AND code IS NOT NULL)
+        OR (code_codec <> 'plain' AND code_blob IS NOT NULL)
+    )
+);
+
+-- Live diagrams and trash are indexed separately so listing one never scans the other
+CREATE INDEX idx_t_diagrams_user_live ON t_diagrams(user_id, updated_at DESC) WHERE is_deleted = FALSE;
+CREATE INDEX idx_t_diagrams_user_trash ON t_diagrams(user_id, deleted_at DESC NULLS LAST, id DESC) WHERE is_deleted = TRUE;
+CREATE INDEX idx_t_diagrams_trash_deleted_at ON t_diagrams(deleted_at) WHERE is_deleted = TRUE;
+CREATE INDEX idx_t_diagrams_user_change_seq ON t_diagrams(user_id, change_seq);
+CREATE INDEX idx_t_diagrams_user_folder_live ON t_diagrams(user_id, folder_id, updated_at DESC) WHERE is_deleted = FALSE;
+
+-- Public read-only share links. ``payload`` is the precomputed JSON served
+-- by /api/public/<token>, refreshed whenever the diagram changes; ``etag``
+-- is its content hash. At most one active link per diagram.
+CREATE TABLE t_share_links (
+    id SERIAL PRIMARY KEY,
+    diagram_id INTEGER NOT NULL REFERENCES t_diagrams(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES t_users(id) ON DELETE CASCADE,
+    token VARCHAR(64) UNIQUE NOT NULL,
+    payload TEXT NOT NULL,
+    etag VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP,
+    revoked_at TIMESTAMP
+);
+
+CREATE UNIQUE INDEX idx_t_share_links_diagram_active ON t_share_links(diagram_id) WHERE revoked_at IS NULL;
+
+-- Per-user storage usage, maintained by trg_t_diagrams_user_usage in the
+-- same transaction as every diagram write. Live and trashed diagrams are
+-- counted separately; quotas apply to live usage.
+CREATE TABLE t_user_usage (
+    user_id INTEGER PRIMARY KEY REFERENCES t_users(id) ON DELETE CASCADE,
+    diagram_count INTEGER NOT NULL DEFAULT 0,
+    bytes_used BIGINT NOT NULL DEFAULT 0,
+    trash_count INTEGER NOT NULL DEFAULT 0,
+    trash_bytes BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_t_diagrams_user_id ON t_diagrams(user_id);
+-- Highest change_seq of each user's purged diagrams (see trash_purger.py).
+-- Their tombstones are gone, so a change feed cursor below it cannot be
+-- served incrementally and the client must resync.
+CREATE TABLE t_change_watermarks (
+    user_id INTEGER PRIMARY KEY REFERENCES t_users(id) ON DELETE CASCADE,
+    purged_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Idempotency-Key claims and the responses they produced (see idempotency.py).
+-- ``status_code`` is NULL while the first request is still running.
+CREATE TABLE t_idempotency_keys (
+    user_id INTEGER NOT NULL REFERENCES t_users(id) ON DELETE CASCADE,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_body TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX idx_t_idempotency_keys_expires_at ON t_idempotency_keys(expires_at);
+
+-- Shared zstd dictionaries for compressing small diagrams
+CREATE TABLE t_codec_dictionaries (
+    id SERIAL PRIMARY KEY,
+    dict_data BYTEA NOT NULL,
+    sample_count INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Progress of backfill jobs over t_diagrams (see backfill.py). ``last_id`` is
+-- the last diagram id written; a resumed run continues after it.
+CREATE TABLE t_backfill_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    rows_updated BIGINT NOT NULL DEFAULT 0,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP,
+    completed_at TIMESTAMP
+);
 
 -- Sessions table (for JWT token management and revocation)
 CREATE TABLE t_sessions (
@@ -79,12 +200,20 @@ CREATE TABLE t_audit_logs (
     ip_address VARCHAR(45),
     user_agent TEXT,
     metadata JSONB,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_t_audit_logs_user_id ON t_audit_logs(user_id);
+-- Keyset pagination runs on (created_at, id): within a user or a resource,
+-- or over everyone for the unfiltered admin listing, each page an index
+-- range read in order. The unordered NDJSON export scans time ranges
+-- through the BRIN index, which stays tiny because rows are appended in
+-- time order.
+CREATE INDEX idx_t_audit_logs_user_created ON t_audit_logs(user_id, created_at DESC, id DESC);
 CREATE INDEX idx_t_audit_logs_action ON t_audit_logs(action);
-CREATE INDEX idx_t_audit_logs_resource ON t_audit_logs(resource_type, resource_id);
+CREATE INDEX idx_t_audit_logs_resource_created ON t_audit_logs(resource_type, resource_id, created_at DESC, id DESC);
+CREATE INDEX idx_t_audit_logs_created ON t_audit_logs(created_at DESC, id DESC);
+CREATE INDEX idx_t_audit_logs_created_brin ON t_audit_logs USING BRIN (created_at);
+
 -- Function to clean up expired sessions and tokens
 CREATE OR REPLACE FUNCTION cleanup_expired_tokens()
 RETURNS void AS $$
@@ -93,3 +222,174 @@ BEGIN
     DELETE FROM t_refresh_tokens WHERE expires_at < CURRENT_TIMESTAMP AND is_revoked = FALSE;
 END;
 $$ language 'plpgsql';
+
+-- Advance the change cursor whenever a diagram is created, edited, deleted or
+-- restored. Maintenance writes that leave updated_at/is_deleted untouched do
+-- not show up in the change feed.
+--
+-- Sequence values are handed out in nextval order, not commit order. The
+-- per-user advisory lock (class 2, held until commit) makes one user's
+-- writers take values one transaction at a time, so a user's change_seq
+-- values become visible in increasing order and a feed cursor never moves
+-- past a change that is still uncommitted. quota.py takes the same lock
+-- before locking t_user_usage so both are always acquired in this order.
+CREATE OR REPLACE FUNCTION bump_diagram_change_seq()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT'
+       OR NEW.updated_at IS DISTINCT FROM OLD.updated_at
+       OR NEW.is_deleted IS DISTINCT FROM OLD.is_deleted THEN
+        PERFORM pg_advisory_xact_lock(2, NEW.user_id);
+        NEW.change_seq := nextval('t_diagrams_change_seq');
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trg_t_diagrams_change_seq
+    BEFORE INSERT OR UPDATE ON t_diagrams
+    FOR EACH ROW EXECUTE FUNCTION bump_diagram_change_seq();
+
+-- Wake long-polling change feed clients of the affected user
+CREATE OR REPLACE FUNCTION notify_diagram_change()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.change_seq <> OLD.change_seq THEN
+        PERFORM pg_notify('diagram_changes', NEW.user_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trg_t_diagrams_notify_change
+    AFTER INSERT OR UPDATE ON t_diagrams
+    FOR EACH ROW EXECUTE FUNCTION notify_diagram_change();
+
+-- Ids of a folder's ancestors and the folder itself, from its materialized path
+CREATE OR REPLACE FUNCTION folder_path_ids(folder_path TEXT)
+RETURNS INTEGER[] AS $$
+    SELECT string_to_array(trim(both '/' from folder_path), '/')::INTEGER[];
+$$ language 'sql' IMMUTABLE;
+
+-- Add ``delta`` live diagrams to a folder and all of its ancestors
+CREATE OR REPLACE FUNCTION adjust_folder_diagram_count(target_folder_id INTEGER, delta INTEGER)
+RETURNS void AS $$
+BEGIN
+    UPDATE t_folders
+    SET diagram_count = diagram_count + CASE WHEN id = target_folder_id THEN delta ELSE 0 END,
+        subtree_diagram_count = subtree_diagram_count + delta
+    WHERE id = ANY (
+        SELECT unnest(folder_path_ids(path)) FROM t_folders WHERE id = target_folder_id
+    );
+END;
+$$ language 'plpgsql';
+
+-- Keep folder diagram counts in step with diagram inserts, moves, deletes,
+-- restores and purges. Takes the owner's folder structure lock in shared
+-- mode so counts never race with a concurrent folder move.
+CREATE OR REPLACE FUNCTION maintain_folder_diagram_counts()
+RETURNS trigger AS $$
+DECLARE
+    old_folder_id INTEGER;
+    new_folder_id INTEGER;
+    owner_id INTEGER;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        owner_id := OLD.user_id;
+        IF OLD.is_deleted IS NOT TRUE THEN
+            old_folder_id := OLD.folder_id;
+        END IF;
+    END IF;
+
+    IF TG_OP <> 'DELETE' THEN
+        owner_id := NEW.user_id;
+        IF NEW.is_deleted IS NOT TRUE THEN
+            new_folder_id := NEW.folder_id;
+        END IF;
+    END IF;
+
+    IF old_folder_id IS NOT DISTINCT FROM new_folder_id THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock_shared(1, owner_id);
+
+    IF old_folder_id IS NOT NULL THEN
+        PERFORM adjust_folder_diagram_count(old_folder_id, -1);
+    END IF;
+
+    IF new_folder_id IS NOT NULL THEN
+        PERFORM adjust_folder_diagram_count(new_folder_id, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trg_t_diagrams_folder_counts
+    AFTER INSERT OR UPDATE OF folder_id, is_deleted OR DELETE ON t_diagrams
+    FOR EACH ROW EXECUTE FUNCTION maintain_folder_diagram_counts();
+
+-- Stored size of a diagram, as counted against the storage quota
+CREATE OR REPLACE FUNCTION diagram_storage_bytes(code TEXT, code_blob BYTEA, thumbnail TEXT)
+RETURNS BIGINT AS $$
+    SELECT COALESCE(octet_length(code), 0)::BIGINT
+         + COALESCE(octet_length(code_blob), 0)
+         + COALESCE(octet_length(thumbnail), 0);
+$$ language 'sql' IMMUTABLE;
+
+-- Apply the usage delta of a diagram insert, edit, delete, restore or purge
+CREATE OR REPLACE FUNCTION maintain_user_usage()
+RETURNS trigger AS $$
+DECLARE
+    owner_id INTEGER;
+    live_count INTEGER := 0;
+    live_bytes BIGINT := 0;
+    trashed_count INTEGER := 0;
+    trashed_bytes BIGINT := 0;
+    row_bytes BIGINT;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        owner_id := OLD.user_id;
+        row_bytes := diagram_storage_bytes(OLD.code, OLD.code_blob, OLD.thumbnail);
+        IF OLD.is_deleted IS TRUE THEN
+            trashed_count := trashed_count - 1;
+            trashed_bytes := trashed_bytes - row_bytes;
+        ELSE
+            live_count := live_count - 1;
+            live_bytes := live_bytes - row_bytes;
+        END IF;
+    END IF;
+
+    IF TG_OP <> 'DELETE' THEN
+        owner_id := NEW.user_id;
+        row_bytes := diagram_storage_bytes(NEW.code, NEW.code_blob, NEW.thumbnail);
+        IF NEW.is_deleted IS TRUE THEN
+            trashed_count := trashed_count + 1;
+            trashed_bytes := trashed_bytes + row_bytes;
+        ELSE
+            live_count := live_count + 1;
+            live_bytes := live_bytes + row_bytes;
+        END IF;
+    END IF;
+
+    IF live_count = 0 AND live_bytes = 0 AND trashed_count = 0 AND trashed_bytes = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO t_user_usage (user_id, diagram_count, bytes_used, trash_count, trash_bytes)
+    VALUES (owner_id, live_count, live_bytes, trashed_count, trashed_bytes)
+    ON CONFLICT (user_id) DO UPDATE
+    SET diagram_count = t_user_usage.diagram_count + EXCLUDED.diagram_count,
+        bytes_used = t_user_usage.bytes_used + EXCLUDED.bytes_used,
+        trash_count = t_user_usage.trash_count + EXCLUDED.trash_count,
+        trash_bytes = t_user_usage.trash_bytes + EXCLUDED.trash_bytes,
+        updated_at = CURRENT_TIMESTAMP;
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER trg_t_diagrams_user_usage
+    AFTER INSERT OR UPDATE OF code, code_blob, thumbnail, is_deleted OR DELETE ON t_diagrams
+    FOR EACH ROW EXECUTE FUNCTION maintain_user_usage();
@@ -0,0 +1,82 @@
+"""Public read-only share links.
+
+The response body of a share link is built once - when the link is
+created and whenever its diagram changes - and stored in
+``t_share_links.payload`` together with its ETag. Serving a public read
+is then a token lookup, usually answered from ``share_cache`` without
+touching the database or re-serializing anything.
+"""
+import hashlib
+import json
+import secrets
+
+from cache import share_cache
+from database import db
+from storage_codec import code_codec
+
+
+def new_token():
+    """Return a new unguessable share token."""
+    return secrets.token_urlsafe(24)
+
+
+def build_payload(diagram):
+    """Return the (payload, etag) pair for a ``t_diagrams`` row."""
+    payload = json.dumps({
+        'title': diagram['title'],
+        'code': code_codec.decode_row(diagram),
+        'thumbnail': diagram['thumbnail'],
+        'updated_at': diagram['updated_at'].isoformat() if diagram['updated_at'] else None
+    }, separators=(',', ':'))
+    etag = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+    return payload, etag
+
+
+def refresh_links(cursor, diagram):
+    """Rebuild the payload of a diagram's active share link after an edit.
+
+    Runs on the caller's cursor, in the same transaction as the edit, so
+    the stored payload never falls behind the diagram. Returns the tokens
+    to pass to ``invalidate_tokens`` once the transaction has committed.
+    """
+    payload, etag = build_payload(diagram)
+    cursor.execute("""
+        UPDATE t_share_links
+        SET payload = %s, etag = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE diagram_id = %s AND revoked_at IS NULL AND etag <> %s
+        RETURNING token
+    """, (payload, etag, diagram['id'], etag))
+    return [row['token'] for row in cursor.fetchall()]
+
+
+def invalidate_tokens(tokens):
+    """Drop cached payloads of share links."""
+    for token in tokens:
+        share_cache.invalidate(token)
+
+
+def invalidate_links(diagram_ids):
+    """Drop cached payloads of the diagrams' active share links."""
+    query = """
+        SELECT token FROM t_share_links
+        WHERE diagram_id = ANY(%s) AND revoked_at IS NULL
+    """
+    rows = db.execute_query(query, (list(diagram_ids),), fetch_all=True)
+    invalidate_tokens(row['token'] for row in rows)
+
+
+def _load_public_payload(token):
+    """Fetch the payload of an active link to a live diagram, or None."""
+    query = """
+        SELECT s.payload, s.etag
+        FROM t_share_links s
+        JOIN t_diagrams d ON d.id = s.diagram_id
+        WHERE s.token = %s AND s.revoked_at IS NULL AND d.is_deleted = FALSE
+    """
+    row = db.execute_query(query, (token,), fetch_one=True)
+    return {'payload': row['payload'], 'etag': row['etag']} if row else None
+
+
+def get_public_payload(token):
+    """Return ``{'payload', 'etag'}`` for a share token, or None if not shared."""
+    return share_cache.get_or_load(token, 'payload', lambda: _load_public_payload(token))
@@ -0,0 +1,299 @@
+"""Compressed storage for diagram code.
+
+Diagram code is stored either as plain text in ``t_diagrams.code`` or
+compressed in ``t_diagrams.code_blob``, tagged by ``code_codec``:
+
+- ``plain``       - uncompressed, in ``code``
+- ``zstd``        - zstd frame, in ``code_blob``
+- ``zstd:<id>``   - zstd frame compressed with the shared dictionary
+                    ``t_codec_dictionaries.id = <id>``, in ``code_blob``
+
+Reads decode every tag regardless of ``DIAGRAM_CODE_CODEC``, so the
+write codec can be switched at any time.
+
+Command line usage::
+
+    python storage_codec.py train --samples 5000 --dict-size 16384
+    python storage_codec.py migrate --batch-size 500 --pause 0.1
+    python storage_codec.py stats
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CODEC_PLAIN = 'plain'
+CODEC_ZSTD = 'zstd'
+
+
+class CodeCodec:
+    """Encodes diagram code for storage and decodes it on read.
+
+    zstd contexts are not thread-safe, so compressors and decompressors
+    are cached per thread. Dictionaries are immutable once stored and are
+    cached per process after their first use.
+    """
+
+    def __init__(self, codec=None):
+        self.codec = codec or os.getenv('DIAGRAM_CODE_CODEC', CODEC_PLAIN)
+        self.level = int(os.getenv('DIAGRAM_CODE_ZSTD_LEVEL', 3))
+        # Code up to this many bytes is compressed with the shared dictionary
+        self.dict_max_size = int(os.getenv('DIAGRAM_CODE_DICT_MAX_SIZE', 8192))
+        self.dict_refresh_interval = 300
+        self._dictionaries = {}
+        self._active_dict_id = None
+        self._active_dict_loaded_at = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _zstd():
+        """Import zstandard on first use."""
+        import zstandard
+        return zstandard
+
+    def _dictionary(self, dict_id):
+        """Return the zstd dictionary with the given id, loading it if needed."""
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is not None:
+            return dictionary
+
+        query = "SELECT dict_data FROM t_codec_dictionaries WHERE id = %s"
+        row = db.execute_query(query, (dict_id,), fetch_one=True)
+        if not row:
+            raise LookupError(f"Compression dictionary {dict_id} not found")
+
+        return self.add_dictionary(dict_id, bytes(row['dict_data']))
+
+    def add_dictionary(self, dict_id, dict_data):
+        """Register a dictionary in the process cache and return it."""
+        zstd = self._zstd()
+        dictionary = zstd.ZstdCompressionDict(dict_data)
+        dictionary.precompute_compress(level=self.level)
+        with self._lock:
+            self._dictionaries[dict_id] = dictionary
+        return dictionary
+
+    def set_active_dictionary(self, dict_id, dict_data=None):
+        """Use the given dictionary for new writes."""
+        if dict_data is not None:
+            self.add_dictionary(dict_id, dict_data)
+        with self._lock:
+            self._active_dict_id = dict_id
+            self._active_dict_loaded_at = time.monotonic()
+
+    def _active_dictionary_id(self):
+        """Return the id of the newest stored dictionary, refreshed periodically."""
+        loaded_at = self._active_dict_loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.dict_refresh_interval:
+            return self._active_dict_id
+
+        query = "SELECT id FROM t_codec_dictionaries ORDER BY id DESC LIMIT 1"
+        row = db.execute_query(query, fetch_one=True)
+        self.set_active_dictionary(row['id'] if row else None)
+        return self._active_dict_id
+
+    def _thread_cache(self, name):
+        """Return a dict stored on this thread under ``name``."""
+        cache = getattr(self._local, name, None)
+        if cache is None:
+            cache = {}
+            setattr(self._local, name, cache)
+        return cache
+
+    def _compressor(self, dict_id):
+        """Return this thread's compressor for a dictionary id (None for no dictionary)."""
+        compressors = self._thread_cache('compressors')
+        compressor = compressors.get(dict_id)
+        if compressor is None:
+            zstd = self._zstd()
+            if dict_id is None:
+                compressor = zstd.ZstdCompressor(level=self.level)
+            else:
+                compressor = zstd.ZstdCompressor(level=self.level, dict_data=self._dictionary(dict_id))
+            compressors[dict_id] = compressor
+        return compressor
+
+    def _decompressor(self, dict_id):
+        """Return this thread's decompressor for a dictionary id (None for no dictionary)."""
+        decompressors = self._thread_cache('decompressors')
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            zstd = self._zstd()
+            if dict_id is None:
+                decompressor = zstd.ZstdDecompressor()
+            else:
+                decompressor = zstd.ZstdDecompressor(dict_data=self._dictionary(dict_id))
+            decompressors[dict_id] = decompressor
+        return decompressor
+
+    def encode(self, code):
+        """Encode code for storage.
+
+        Returns a tuple of (code, code_blob, code_codec) matching the
+        ``t_diagrams`` columns. Falls back to plain text when compression
+        does not make the value smaller.
+        """
+        if self.codec != CODEC_ZSTD:
+            return code, None, CODEC_PLAIN
+
+        raw = code.encode('utf-8')
+        dict_id = self._active_dictionary_id() if len(raw) <= self.dict_max_size else None
+        blob = self._compressor(dict_id).compress(raw)
+
+        if len(blob) >= len(raw):
+            return code, None, CODEC_PLAIN
+
+        tag = CODEC_ZSTD if dict_id is None else f"{CODEC_ZSTD}:{dict_id}"
+        return None, blob, tag
+
+    def decode(self, code, code_blob, code_codec):
+        """Return the plain text code for stored column values."""
+        if not code_codec or code_codec == CODEC_PLAIN:
+            return code
+
+        name, _, dict_id = code_codec.partition(':')
+        if name != CODEC_ZSTD:
+            raise ValueError(f"Unknown code codec: {code_codec}")
+
+        decompressor = self._decompressor(int(dict_id) if dict_id else None)
+        return decompressor.decompress(bytes(code_blob)).decode('utf-8')
+
+    def decode_row(self, row):
+        """Return the plain text code of a ``t_diagrams`` row."""
+        return self.decode(row['code'], row.get('code_blob'), row.get('code_codec'))
+
+
+# Global codec instance
+code_codec = CodeCodec()
+
+
+def train_dictionary(sample_count, dict_size):
+    """Train a shared dictionary from a random sample of stored diagrams."""
+    zstd = code_codec._zstd()
+
+    query = """
+        SELECT code, code_blob, code_codec FROM t_diagrams
+        ORDER BY random()
+        LIMIT %s
+    """
+    rows = db.execute_query(query, (sample_count,), fetch_all=True)
+    samples = [code_codec.decode_row(row).encode('utf-8') for row in rows]
+    samples = [s for s in samples if len(s) <= code_codec.dict_max_size]
+
+    dictionary = zstd.train_dictionary(dict_size, samples, level=code_codec.level)
+
+    query = """
+        INSERT INTO t_codec_dictionaries (dict_data, sample_count)
+        VALUES (%s, %s)
+        RETURNING id
+    """
+    row = db.execute_query(
+        query,
+        (psycopg2.Binary(dictionary.as_bytes()), len(samples)),
+        fetch_one=True
+    )
+    return row['id'], len(samples), len(dictionary.as_bytes())
+
+
+def migrate(batch_size, pause):
+    """Compress plain rows online, in id-ordered batches.
+
+    Rows edited between the read and the write are skipped (their
+    ``updated_at`` moved on) and picked up again by a later run.
+    """
+    codec = CodeCodec(CODEC_ZSTD)
+    last_id = 0
+    migrated = 0
+
+    while True:
+        query = """
+            SELECT id, code, updated_at FROM t_diagrams
+            WHERE id > %s AND code_codec = %s
+            ORDER BY id
+            LIMIT %s
+        """
+        rows = db.execute_query(query, (last_id, CODEC_PLAIN, batch_size), fetch_all=True)
+        if not rows:
+            break
+
+        last_id = rows[-1]['id']
+        values = []
+        for row in rows:
+            code, code_blob, tag = codec.encode(row['code'])
+            if tag != CODEC_PLAIN:
+                values.append((row['id'], code, code_blob, tag, row['updated_at']))
+
+        if values:
+            with db.get_cursor() as cursor:
+                execute_values(cursor, """
+                    UPDATE t_diagrams AS d
+                    SET code = v.code, code_blob = v.code_blob, code_codec = v.code_codec
+                    FROM (VALUES %s) AS v(id, code, code_blob, code_codec, updated_at)
+                    WHERE d.id = v.id
+                    AND d.code_codec = 'plain'
+                    AND d.updated_at IS NOT DISTINCT FROM v.updated_at
+                """, values, template='(%s::int, %s::text, %s::bytea, %s::varchar, %s::timestamp)')
+                migrated += cursor.rowcount
+
+        logger.info("Compressed %d diagrams (last id %d)", migrated, last_id)
+        time.sleep(pause)
+
+    return migrated
+
+
+def print_stats():
+    """Print stored size per codec."""
+    query = """
+        SELECT code_codec,
+               COUNT(*) AS diagrams,
+               COALESCE(SUM(octet_length(code)), 0) AS text_bytes,
+               COALESCE(SUM(octet_length(code_blob)), 0) AS blob_bytes
+        FROM t_diagrams
+        GROUP BY code_codec
+        ORDER BY code_codec
+    """
+    for row in db.execute_query(query, fetch_all=True):
+        print(f"{row['code_codec']:<12} {row['diagrams']:>10} diagrams "
+              f"{row['text_bytes'] + row['blob_bytes']:>14} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Diagram code compression tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='train a shared zstd dictionary')
+    train_parser.add_argument('--samples', type=int, default=5000)
+    train_parser.add_argument('--dict-size', type=int, default=16384)
+
+    migrate_parser = subparsers.add_parser('migrate', help='compress existing plain rows')
+    migrate_parser.add_argument('--batch-size', type=int, default=500)
+    migrate_parser.add_argument('--pause', type=float, default=0.1)
+
+    subparsers.add_parser('stats', help='show stored size per codec')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    if args.command == 'train':
+        dict_id, samples, size = train_dictionary(args.samples, args.dict_size)
+        print(f"Stored dictionary {dict_id} ({size} bytes, trained on {samples} diagrams)")
+    elif args.command == 'migrate':
+        print(f"Compressed {migrate(args.batch_size, args.pause)} diagrams.")
+    else:
+        print_stats()
+
+
+if __name__ == '__main__':
+    main()
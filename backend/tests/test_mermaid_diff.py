@@ -0,0 +1,150 @@
+"""Tests for the Mermaid flowchart parser and diff."""
+import pytest
+
+from mermaid_diff import parse_flowchart, diff_diagrams
+
+
+def flowchart(*lines):
+    return '\n'.join(('graph TD',) + lines)
+
+
+@pytest.mark.parametrize('code, nodes, edges, other', [
+    # Plain and labelled arrows
+    (flowchart('A --> B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): ''},
+     []),
+    (flowchart('A -->|yes| B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): 'yes'},
+     []),
+    # Inline text with and without spaces
+    (flowchart('A -- text --> B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): 'text'},
+     []),
+    (flowchart('A--text-->B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): 'text'},
+     []),
+    (flowchart('A==text==>B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'thick>', 0): 'text'},
+     []),
+    (flowchart('A-.text.->B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'dotted>', 0): 'text'},
+     []),
+    (flowchart('A--ok-->B--more-->C'),
+     {'A': ('A', None), 'B': ('B', None), 'C': ('C', None)},
+     {('A', 'B', 'solid>', 0): 'ok', ('B', 'C', 'solid>', 0): 'more'},
+     []),
+    # Arrow heads and styles, not mistaken for inline text
+    (flowchart('A --o B --> C'),
+     {'A': ('A', None), 'B': ('B', None), 'C': ('C', None)},
+     {('A', 'B', 'solido', 0): '', ('B', 'C', 'solid>', 0): ''},
+     []),
+    (flowchart('A --- B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid', 0): ''},
+     []),
+    (flowchart('A -.-> B', 'B ==> C', 'C <--> D'),
+     {'A': ('A', None), 'B': ('B', None), 'C': ('C', None), 'D': ('D', None)},
+     {('A', 'B', 'dotted>', 0): '', ('B', 'C', 'thick>', 0): '', ('C', 'D', '<solid>', 0): ''},
+     []),
+    # & chains
+    (flowchart('A & B --> C & D'),
+     {'A': ('A', None), 'B': ('B', None), 'C': ('C', None), 'D': ('D', None)},
+     {('A', 'C', 'solid>', 0): '', ('A', 'D', 'solid>', 0): '',
+      ('B', 'C', 'solid>', 0): '', ('B', 'D', 'solid>', 0): ''},
+     []),
+    # Shapes and class suffixes
+    (flowchart('A[Start] --> B{Ok?}', 'B --> C((Done))', 'C --> D[(Store)]'),
+     {'A': ('Start', '['), 'B': ('Ok?', '{'), 'C': ('Done', '(('), 'D': ('Store', '[(')},
+     {('A', 'B', 'solid>', 0): '', ('B', 'C', 'solid>', 0): '', ('C', 'D', 'solid>', 0): ''},
+     []),
+    (flowchart('A["Label [x]"]:::hot --> B:::cold'),
+     {'A': ('Label [x]', '['), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): ''},
+     []),
+    # Repeated links are counted, statements may share a line
+    (flowchart('A --> B; A --> B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): '', ('A', 'B', 'solid>', 1): ''},
+     []),
+    # Inline text combined with a pipe label
+    (flowchart('A-- go -->|y| B'),
+     {'A': ('A', None), 'B': ('B', None)},
+     {('A', 'B', 'solid>', 0): 'go y'},
+     []),
+    # Text containing another link opener, or a bare --, is not a link:
+    # the statement is kept verbatim rather than inventing nodes
+    (flowchart('A -- a -- b --> C'),
+     {},
+     {},
+     ['A -- a -- b --> C']),
+    (flowchart('A -- B'),
+     {},
+     {},
+     ['A -- B']),
+])
+def test_parse_flowchart(code, nodes, edges, other):
+    parsed = parse_flowchart(code)
+    assert parsed['nodes'] == nodes
+    assert parsed['edges'] == edges
+    assert sorted(parsed['other']) == other
+
+
+def test_parse_flowchart_ignores_comments_front_matter_and_styling():
+    code = '\n'.join([
+        '---', 'title: Demo', '---',
+        'flowchart LR',
+        '%% a comment',
+        'subgraph one',
+        'A --> B',
+        'end',
+        'style A fill:#f9f',
+    ])
+    parsed = parse_flowchart(code)
+    assert parsed['edges'] == {('A', 'B', 'solid>', 0): ''}
+    assert sorted(parsed['other']) == ['end', 'style A fill:#f9f', 'subgraph one']
+
+
+def test_parse_flowchart_rejects_other_diagram_types():
+    assert parse_flowchart('sequenceDiagram\nA->>B: hi') is None
+
+
+def test_diff_ignores_statement_order_and_link_length():
+    before = flowchart('A --> B', 'B --> C')
+    after = flowchart('B ---> C', 'A --> B')
+    result = diff_diagrams(before, after)
+    assert result['type'] == 'flowchart'
+    for section in ('nodes', 'edges'):
+        assert result[section] == {'added': [], 'removed': [], 'changed': []}
+
+
+def test_diff_reports_inline_label_change_without_phantom_nodes():
+    result = diff_diagrams(flowchart('A--yes-->B'), flowchart('A--no-->B'))
+    assert result['nodes'] == {'added': [], 'removed': [], 'changed': []}
+    assert result['edges']['changed'] == [
+        {'from': 'A', 'to': 'B', 'kind': 'solid>', 'before': 'yes', 'after': 'no'}
+    ]
+
+
+def test_diff_reports_added_removed_and_changed_nodes():
+    result = diff_diagrams(
+        flowchart('A[Start] --> B'),
+        flowchart('A[Begin] --> C')
+    )
+    assert [n['id'] for n in result['nodes']['added']] == ['C']
+    assert [n['id'] for n in result['nodes']['removed']] == ['B']
+    assert result['nodes']['changed'][0]['after']['label'] == 'Begin'
+    assert result['edges']['added'] == [{'from': 'A', 'to': 'C', 'kind': 'solid>', 'label': ''}]
+    assert result['edges']['removed'] == [{'from': 'A', 'to': 'B', 'kind': 'solid>', 'label': ''}]
+
+
+def test_diff_falls_back_to_text():
+    result = diff_diagrams('sequenceDiagram\nA->>B: hi', 'sequenceDiagram\nA->>B: bye')
+    assert result['type'] == 'text'
+    assert result['lines']['added'] == 1
+    assert result['lines']['removed'] == 1
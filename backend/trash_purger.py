@@ -0,0 +1,136 @@
+"""Background purge of expired soft-deleted diagrams."""
+import logging
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How long deleted diagrams stay restorable before they are purged
+TRASH_RETENTION_DAYS = int(os.getenv('TRASH_RETENTION_DAYS', 30))
+
+# Arbitrary application-wide key so only one process purges at a time
+PURGE_LOCK_KEY = 0x7472617368
+
+
+class TrashPurger:
+    """Hard-deletes expired trash in small batches.
+
+    Each batch deletes at most ``batch_size`` rows in its own short
+    transaction and is followed by a pause, so purging never holds many
+    row locks or produces a burst of WAL. Failures back off exponentially.
+    """
+
+    def __init__(self, retention_days=TRASH_RETENTION_DAYS):
+        self.retention_days = retention_days
+        self.batch_size = int(os.getenv('TRASH_PURGE_BATCH_SIZE', 100))
+        self.batch_pause = float(os.getenv('TRASH_PURGE_BATCH_PAUSE', 0.5))
+        self.interval = float(os.getenv('TRASH_PURGE_INTERVAL', 3600))
+        self.max_backoff = float(os.getenv('TRASH_PURGE_MAX_BACKOFF', 300))
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def purge_batch(self):
+        """Purge one batch of expired trash.
+
+        Returns the number of deleted rows, or None if another process
+        currently holds the purge lock. Each owner's purge watermark is
+        raised in the same statement, so the change feed can tell clients
+        whose cursor predates a purged tombstone to resync.
+        """
+        with db.get_cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (PURGE_LOCK_KEY,))
+            if not cursor.fetchone()['locked']:
+                return None
+
+            cursor.execute("""
+                WITH purged AS (
+                    DELETE FROM t_diagrams
+                    WHERE id IN (
+                        SELECT id FROM t_diagrams
+                        WHERE is_deleted = TRUE
+                        AND deleted_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+                        ORDER BY deleted_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING user_id, change_seq
+                ), watermarks AS (
+                    INSERT INTO t_change_watermarks (user_id, purged_seq)
+                    SELECT user_id, MAX(change_seq) FROM purged GROUP BY user_id
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET purged_seq = GREATEST(t_change_watermarks.purged_seq, EXCLUDED.purged_seq),
+                        updated_at = CURRENT_TIMESTAMP
+                )
+                SELECT COUNT(*) AS purged FROM purged
+            """, (self.retention_days, self.batch_size))
+            return cursor.fetchone()['purged']
+
+    def run_once(self):
+        """Purge batches until no expired trash is left.
+
+        Returns the total number of purged diagrams.
+        """
+        total = 0
+
+        while not self._stop_event.is_set():
+            purged = self.purge_batch()
+            if not purged:
+                break
+
+            total += purged
+            if purged < self.batch_size:
+                break
+
+            self._stop_event.wait(self.batch_pause)
+
+        if total:
+            logger.info("Purged %d expired diagrams from trash", total)
+        return total
+
+    def run_forever(self):
+        """Run purge passes every ``interval`` seconds until stopped."""
+        backoff = self.batch_pause or 1
+
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+                backoff = self.batch_pause or 1
+                delay = self.interval
+            except Exception:
+                logger.exception("Trash purge failed, retrying in %.1fs", backoff)
+                delay = backoff
+                backoff = min(backoff * 2, self.max_backoff)
+
+            self._stop_event.wait(delay)
+
+    def start(self):
+        """Start purging in a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        # Fresh event: one inherited across fork may have a stale lock
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.run_forever, name='trash-purger', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the purge thread, waiting for the current batch to finish."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+# Global trash purger instance
+trash_purger = TrashPurger()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    print(f"Purging diagrams deleted more than {TRASH_RETENTION_DAYS} days ago...")
+    print(f"Purged {trash_purger.run_once()} diagrams.")
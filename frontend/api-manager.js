@@ -228,7 +228,16 @@ export class ApiManager {
         }
     }
 
-    async saveDiagram(title, code, thumbnail = null) {
+    // One key per logical write, reused by every retry of it, so the
+    // backend replays the first response instead of writing twice
+    newIdempotencyKey() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    async saveDiagram(title, code, thumbnail = null, idempotencyKey = this.newIdempotencyKey()) {
         if (!this.user) throw new Error("User not authenticated");
 
         try {
@@ -236,7 +245,8 @@ export class ApiManager {
                 method: 'POST',
                 headers: {
                     'Authorization': `Bearer ${this.accessToken}`,
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey
                 },
                 body: JSON.stringify({
                     title,
@@ -247,7 +257,7 @@ export class ApiManager {
 
             if (response.status === 401) {
                 await this.refreshAccessToken();
-                return this.saveDiagram(title, code, thumbnail);
+                return this.saveDiagram(title, code, thumbnail, idempotencyKey);
             }
 
             if (!response.ok) {
@@ -299,20 +309,21 @@ export class ApiManager {
         }
     }
 
-    async deleteDiagram(diagramId) {
+    async deleteDiagram(diagramId, idempotencyKey = this.newIdempotencyKey()) {
         if (!this.user) throw new Error("User not authenticated");
 
         try {
             const response = await fetch(`${API_BASE_URL}/diagrams/${diagramId}`, {
                 method: 'DELETE',
                 headers: {
-                    'Authorization': `Bearer ${this.accessToken}`
+                    'Authorization': `Bearer ${this.accessToken}`,
+                    'Idempotency-Key': idempotencyKey
                 }
             });
 
             if (response.status === 401) {
                 await this.refreshAccessToken();
-                return this.deleteDiagram(diagramId);
+                return this.deleteDiagram(diagramId, idempotencyKey);
             }
 
             if (!response.ok) {
@@ -327,7 +338,7 @@ export class ApiManager {
         }
     }
 
-    async updateDiagram(diagramId, code, thumbnail = null) {
+    async updateDiagram(diagramId, code, thumbnail = null, idempotencyKey = this.newIdempotencyKey()) {
         if (!this.user) throw new Error("User not authenticated");
 
         try {
@@ -340,14 +351,15 @@ export class ApiManager {
                 method: 'PUT',
                 headers: {
                     'Authorization': `Bearer ${this.accessToken}`,
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey
                 },
                 body: JSON.stringify(body)
             });
 
             if (response.status === 401) {
                 await this.refreshAccessToken();
-                return this.updateDiagram(diagramId, code, thumbnail);
+                return this.updateDiagram(diagramId, code, thumbnail, idempotencyKey);
             }
 
             if (!response.ok) {
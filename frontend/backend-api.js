@@ -28,6 +28,17 @@ export class BackendAPI {
         return headers;
     }
 
+    /**
+     * New key for one logical write; the retry in fetchWithAuth reuses
+     * it, so the backend replays the first response instead of writing twice
+     */
+    newIdempotencyKey() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
     /**
      * Make authenticated API request with automatic token refresh
      */
@@ -200,6 +211,7 @@ export class BackendAPI {
     async createDiagram(title, code, thumbnail = null) {
         const response = await this.fetchWithAuth(`${API_BASE_URL}/diagrams`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': this.newIdempotencyKey() },
             body: JSON.stringify({ title, code, thumbnail })
         });
 
@@ -216,6 +228,7 @@ export class BackendAPI {
     async updateDiagram(diagramId, updates) {
         const response = await this.fetchWithAuth(`${API_BASE_URL}/diagrams/${diagramId}`, {
             method: 'PUT',
+            headers: { 'Idempotency-Key': this.newIdempotencyKey() },
             body: JSON.stringify(updates)
         });
 
@@ -231,7 +244,8 @@ export class BackendAPI {
      */
     async deleteDiagram(diagramId) {
         const response = await this.fetchWithAuth(`${API_BASE_URL}/diagrams/${diagramId}`, {
-            method: 'DELETE'
+            method: 'DELETE',
+            headers: { 'Idempotency-Key': this.newIdempotencyKey() }
         });
 
         if (response.ok) {